@@ -4,13 +4,19 @@ Avatar Learning and Customization System
 Enables personality adaptation while maintaining dharmic principles
 """
 
+import atexit
 import json
+import sys
+import os
 import re
+import threading
+import time
 import numpy as np
 import logging
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional, Any, DefaultDict, Set
+from typing import Dict, Iterator, List, Tuple, Optional, Any, DefaultDict, Set
+from array import array
 from collections import defaultdict, Counter
 from dataclasses import dataclass, field, asdict
 import hashlib
@@ -26,6 +32,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger('avatar_learning')
 
+TECHNICAL_TERMS = ('algorithm', 'implementation', 'configuration', 'debug', 'optimize')
+EMOJI_PATTERN = re.compile(
+    r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF]'
+)
+
+def response_features(response: str) -> Tuple[int, int, int]:
+    """(word count, technical terms used, emoji count) of an avatar response"""
+    lowered = response.lower()
+    return (
+        len(response.split()),
+        sum(1 for term in TECHNICAL_TERMS if term in lowered),
+        len(EMOJI_PATTERN.findall(response))
+    )
+
+def iter_lines_backwards(path: Path, block_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Yield the non-empty lines of a file last to first, reading fixed-size blocks from the end"""
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        remainder = b''
+        while position > 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            lines = (f.read(step) + remainder).split(b'\n')
+            # The first piece may be the tail of a line that starts in an earlier block
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if remainder.strip():
+            yield remainder
+
 @dataclass
 class InteractionRecord:
     """Represents a single interaction with an avatar"""
@@ -101,29 +139,144 @@ class UserPreferences:
             custom_vocabulary=data.get('custom_vocabulary', {})
         )
 
+@dataclass
+class PreferenceThresholds:
+    """Cut-offs that turn preference statistics into UserPreferences"""
+    alpha: float = 1 / 3                # EWMA weight of the newest positive interaction (~ the last 5)
+    positive_satisfaction: float = 0.5  # Only interactions scored above this shape preferences
+    brief_words: float = 20
+    detailed_words: float = 100
+    technical_high: float = 1.0         # Technical terms per positive response
+    technical_medium: float = 0.4
+    emoji_frequent: float = 3.0         # Emojis per positive response
+    emoji_moderate: float = 0.05        # Roughly one emoji among the last five
+
+@dataclass
+class PreferenceStats:
+    """Running aggregates for a user-avatar pair, updated once per interaction"""
+    interactions: int = 0
+    positive: int = 0
+    response_words: float = 0.0
+    technical_terms: float = 0.0
+    emojis: float = 0.0
+    
+    def update(self, interaction: InteractionRecord, thresholds: PreferenceThresholds) -> None:
+        """Fold one interaction into the averages in constant time"""
+        if interaction.satisfaction_score <= thresholds.positive_satisfaction:
+            self.interactions += 1
+            return
+        self.update_features(interaction.satisfaction_score, *response_features(interaction.avatar_response), thresholds)
+    
+    def update_features(
+        self, satisfaction: float, words: int, technical: int, emojis: int, thresholds: PreferenceThresholds
+    ) -> None:
+        """update() for an interaction already reduced to its response features"""
+        self.interactions += 1
+        if satisfaction <= thresholds.positive_satisfaction:
+            return
+        if self.positive == 0:
+            self.response_words, self.technical_terms, self.emojis = float(words), float(technical), float(emojis)
+        else:
+            alpha = thresholds.alpha
+            self.response_words += alpha * (words - self.response_words)
+            self.technical_terms += alpha * (technical - self.technical_terms)
+            self.emojis += alpha * (emojis - self.emojis)
+        self.positive += 1
+    
+    def apply(self, prefs: UserPreferences, thresholds: PreferenceThresholds) -> None:
+        """Set the preferences these statistics determine"""
+        if self.positive == 0:
+            prefs.technical_depth = "low"
+            prefs.emoji_usage = "minimal"
+            return
+        
+        if self.response_words < thresholds.brief_words:
+            prefs.response_length = "brief"
+        elif self.response_words > thresholds.detailed_words:
+            prefs.response_length = "detailed"
+        else:
+            prefs.response_length = "moderate"
+        
+        if self.technical_terms > thresholds.technical_high:
+            prefs.technical_depth = "high"
+        elif self.technical_terms > thresholds.technical_medium:
+            prefs.technical_depth = "medium"
+        else:
+            prefs.technical_depth = "low"
+        
+        if self.emojis > thresholds.emoji_frequent:
+            prefs.emoji_usage = "frequent"
+        elif self.emojis > thresholds.emoji_moderate:
+            prefs.emoji_usage = "moderate"
+        else:
+            prefs.emoji_usage = "minimal"
+    
+    @classmethod
+    def from_history(cls, interactions: List[InteractionRecord], thresholds: PreferenceThresholds) -> 'PreferenceStats':
+        """Replay a history oldest first; gives the same averages as updating along the way"""
+        stats = cls()
+        for interaction in interactions:
+            stats.update(interaction, thresholds)
+        return stats
+
 class AvatarLearningEngine:
     """
     Handles learning from user interactions to personalize avatar behavior
     while maintaining core personality characteristics.
     """
     
-    def __init__(self, data_dir: str = "/var/lib/kalki/avatars/learning"):
+    def __init__(
+        self,
+        data_dir: str = "/var/lib/kalki/avatars/learning",
+        thresholds: Optional[PreferenceThresholds] = None,
+        flush_interval: float = 30.0,
+        segment_bytes: int = 1024 * 1024,
+        max_segments: int = 10
+    ):
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True)
         
-        # In-memory caches
+        # In-memory caches, filled per user-avatar pair on first access
         self.interaction_history: DefaultDict[str, List[InteractionRecord]] = defaultdict(list)
         self.user_preferences: DefaultDict[str, UserPreferences] = defaultdict(UserPreferences)
         self.personality_adjustments: DefaultDict[str, Dict[str, float]] = defaultdict(dict)
+        self.preference_stats: DefaultDict[str, PreferenceStats] = defaultdict(PreferenceStats)
+        self._loaded_pairs: Set[str] = set()
+        self._user_indexes: Dict[str, Dict[str, Any]] = {}
         
         # Learning parameters
         self.learning_rate = 0.1
         self.max_personality_drift = 0.3  # Prevent major personality changes
         self.min_interactions_for_learning = 5
         self.history_limit = 1000  # Max interactions to keep in memory per user-avatar pair
+        self.thresholds = thresholds or PreferenceThresholds()
+        
+        # Interaction history is stored as numbered segments per user; a full
+        # segment is closed and the oldest beyond max_segments are deleted
+        # by the background flusher, never while recording an interaction
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self._active_segments: Dict[str, Path] = {}
+        self._prune_pending: Set[str] = set()
+        self.history_stats = {'segments_rolled': 0, 'segments_pruned': 0, 'migrated': 0, 'index_writes': 0}
+        # Index counts change on every interaction but are written behind,
+        # like preferences; only a user's first interaction with an avatar
+        # writes index.json straight away
+        self._dirty_indexes: Set[str] = set()
         
-        # Load existing data
-        self._load_data()
+        # Write-behind for preferences: changed pairs are marked dirty and
+        # written out together every flush_interval seconds and at shutdown
+        self.flush_interval = flush_interval
+        self._dirty_preferences: Set[Tuple[str, str]] = set()  # (user_id, avatar_name)
+        self._flush_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._closing = threading.Event()
+        self.flush_stats = {'flushes': 0, 'pairs_written': 0, 'files_written': 0, 'failures': 0, 'last_flush_ms': 0.0, 'max_flush_ms': 0.0}
+        self._flusher = None
+        if flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name='kalki-learning-flush', daemon=True)
+            self._flusher.start()
+        atexit.register(self.close)
     
     def _get_user_avatar_key(self, avatar_name: str, user_id: str) -> str:
         """Generate a unique key for user-avatar pair"""
@@ -135,103 +288,327 @@ class AvatarLearningEngine:
         user_hash = hashlib.sha256(user_id.encode()).hexdigest()[:16]
         return self.data_dir / user_hash
     
-    def _load_data(self) -> None:
-        """Load user interaction data from disk"""
+    def _ensure_loaded(self, avatar_name: str, user_id: str) -> str:
+        """
+        Load a user-avatar pair's recent history and preferences on first access
+
+        Only the pair's own files are touched: the user's index.json says
+        whether the pair has any history, and the most recent history_limit
+        interactions are read backwards from the newest history segment.
+        Index counts are written behind, so after a crash they can lag and
+        fewer interactions are read back until they catch up.
+        """
+        key = self._get_user_avatar_key(avatar_name, user_id)
+        if key in self._loaded_pairs:
+            return key
+        self._loaded_pairs.add(key)
+        
+        user_dir = self._get_user_data_path(user_id)
         try:
-            # Load all user data directories
-            for user_dir in self.data_dir.iterdir():
-                if not user_dir.is_dir():
-                    continue
-                
-                # Load interaction history
-                history_file = user_dir / "interactions.jsonl"
-                if history_file.exists():
-                    with open(history_file, 'r', encoding='utf-8') as f:
-                        for line in f:
-                            try:
-                                data = json.loads(line)
-                                key = f"{data['user_id']}::{data['avatar_name']}"
-                                self.interaction_history[key].append(InteractionRecord.from_dict(data))
-                            except (json.JSONDecodeError, KeyError) as e:
-                                logger.warning(f"Failed to load interaction: {e}")
-                
-                # Load user preferences
-                prefs_file = user_dir / "preferences.json"
-                if prefs_file.exists():
-                    with open(prefs_file, 'r', encoding='utf-8') as f:
-                        prefs_data = json.load(f)
-                        for avatar_name, prefs in prefs_data.items():
-                            key = f"{user_dir.name}::{avatar_name}"
-                            self.user_preferences[key] = UserPreferences.from_dict(prefs)
-            
-            logger.info(f"Loaded data for {len(self.interaction_history)} user-avatar pairs")
+            recorded = self._get_user_index(user_id)['avatars'].get(avatar_name, {}).get('interactions', 0)
+            if recorded:
+                history = self._read_recent_interactions(
+                    self._history_segments(user_id), avatar_name, user_id, min(recorded, self.history_limit)
+                )
+                self.interaction_history[key] = history
+                self.preference_stats[key] = PreferenceStats.from_history(history, self.thresholds)
             
+            prefs_file = user_dir / "preferences.json"
+            if prefs_file.exists() and key not in self.user_preferences:
+                with open(prefs_file, 'r', encoding='utf-8') as f:
+                    prefs = json.load(f).get(avatar_name)
+                if prefs is not None:
+                    self.user_preferences[key] = UserPreferences.from_dict(prefs)
+                    
         except Exception as e:
-            logger.error(f"Error loading learning data: {e}", exc_info=True)
+            logger.error(f"Error loading learning data for {key}: {e}", exc_info=True)
+        
+        return key
+    
+    def _read_recent_interactions(
+        self, segments: List[Path], avatar_name: str, user_id: str, limit: int
+    ) -> List[InteractionRecord]:
+        """The pair's last limit interactions, oldest first, read from the end of the newest segments"""
+        # Cheap byte test before parsing; the user's segments hold every avatar's history
+        marker = ('"avatar_name": ' + json.dumps(avatar_name)).encode('utf-8')
+        records = []
+        for segment in reversed(segments):
+            try:
+                for line in iter_lines_backwards(segment):
+                    if marker not in line:
+                        continue
+                    try:
+                        data = json.loads(line)
+                        if data['avatar_name'] != avatar_name or data['user_id'] != user_id:
+                            continue
+                        records.append(InteractionRecord.from_dict(data))
+                    except (json.JSONDecodeError, KeyError, ValueError) as e:
+                        logger.warning(f"Failed to load interaction: {e}")
+                        continue
+                    if len(records) >= limit:
+                        break
+            except FileNotFoundError:
+                # Pruned since it was listed; everything older is gone too
+                break
+            if len(records) >= limit:
+                break
+        records.reverse()
+        return records
+    
+    def _history_segments(self, user_id: str) -> List[Path]:
+        """
+        The user's history segments, oldest first
+
+        A single interactions.jsonl from before segments existed is moved
+        in as segment 0, so it is read and pruned like any other.
+        """
+        user_dir = self._get_user_data_path(user_id)
+        history_dir = user_dir / "interactions"
+        legacy_file = user_dir / "interactions.jsonl"
+        if legacy_file.exists():
+            history_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(legacy_file, history_dir / f"{0:06d}.jsonl")
+            self.history_stats['migrated'] += 1
+            logger.info(f"Moved {legacy_file} into segmented history")
+        if not history_dir.is_dir():
+            return []
+        # Zero-padded names sort in segment order
+        return sorted(history_dir.glob('[0-9]*.jsonl'))
+    
+    def _get_user_index(self, user_id: str) -> Dict[str, Any]:
+        """
+        The user's index.json: interaction counts per avatar
+
+        Directories written before the index existed get one built from a
+        single pass over their history segments.
+        """
+        index = self._user_indexes.get(user_id)
+        if index is not None:
+            return index
+        
+        user_dir = self._get_user_data_path(user_id)
+        index_file = user_dir / "index.json"
+        try:
+            with open(index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            index = {'user_id': user_id, 'avatars': {}}
+            segments = self._history_segments(user_id)
+            for segment in segments:
+                with open(segment, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            data = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        entry = index['avatars'].setdefault(data.get('avatar_name'), {'interactions': 0})
+                        entry['interactions'] = min(entry['interactions'] + 1, self.history_limit)
+                        entry['last_interaction'] = data.get('timestamp')
+            if segments:
+                self._write_user_index(user_dir, index)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Rebuilding corrupt index {index_file}: {e}")
+            index_file.unlink()
+            return self._get_user_index(user_id)
+        
+        self._user_indexes[user_id] = index
+        return index
+    
+    def _write_user_index(self, user_dir: Path, index: Dict[str, Any]) -> None:
+        """Replace the user's index.json atomically"""
+        with self._flush_lock:
+            body = json.dumps(index)
+        index_file = user_dir / "index.json"
+        tmp = index_file.with_name(f".index.json.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(body)
+        os.replace(tmp, index_file)
+        self.history_stats['index_writes'] += 1
+    
+    def flush_indexes(self) -> int:
+        """Write out the index.json of every user whose counts changed; returns the number written"""
+        with self._flush_lock:
+            dirty, self._dirty_indexes = self._dirty_indexes, set()
+        written = 0
+        for user_id in dirty:
+            try:
+                self._write_user_index(self._get_user_data_path(user_id), self._user_indexes[user_id])
+                written += 1
+            except Exception as e:
+                logger.error(f"Failed to write interaction index: {e}", exc_info=True)
+                with self._flush_lock:
+                    self._dirty_indexes.add(user_id)
+        return written
     
     def _save_interaction(self, avatar_name: str, user_id: str, interaction: InteractionRecord) -> None:
         """Save interaction to disk"""
         try:
             user_dir = self._get_user_data_path(user_id)
-            user_dir.mkdir(parents=True, exist_ok=True)
+            index = self._get_user_index(user_id)
             
-            # Append to interaction history file
-            history_file = user_dir / "interactions.jsonl"
-            with open(history_file, 'a', encoding='utf-8') as f:
+            segment = self._active_segments.get(user_id)
+            if segment is None:
+                segments = self._history_segments(user_id)
+                segment = segments[-1] if segments else user_dir / "interactions" / f"{1:06d}.jsonl"
+                segment.parent.mkdir(parents=True, exist_ok=True)
+            
+            # Append to the active history segment
+            with open(segment, 'a', encoding='utf-8') as f:
                 data = interaction.to_dict()
                 data.update({
                     'avatar_name': avatar_name,
                     'user_id': user_id
                 })
                 f.write(json.dumps(data) + '\n')
+                size = f.tell()
+            
+            # Roll once the segment is full; old segments are pruned off this path
+            if size >= self.segment_bytes:
+                segment = segment.with_name(f"{int(segment.stem) + 1:06d}.jsonl")
+                self.history_stats['segments_rolled'] += 1
+                with self._flush_lock:
+                    self._prune_pending.add(user_id)
+            self._active_segments[user_id] = segment
             
-            # Enforce history limit by rotating if needed
-            if history_file.stat().st_size > 10 * 1024 * 1024:  # 10MB limit
-                self._rotate_history_file(history_file)
+            # Counts saturate at history_limit: they only bound how much
+            # history _ensure_loaded reads back
+            with self._flush_lock:
+                entry = index['avatars'].get(avatar_name)
+                new_avatar = entry is None
+                if new_avatar:
+                    entry = index['avatars'][avatar_name] = {'interactions': 0}
+                entry['interactions'] = min(entry['interactions'] + 1, self.history_limit)
+                entry['last_interaction'] = data['timestamp']
+                self._dirty_indexes.add(user_id)
+            if new_avatar:
+                self._write_user_index(user_dir, index)
                 
         except Exception as e:
             logger.error(f"Failed to save interaction: {e}", exc_info=True)
     
-    def _rotate_history_file(self, history_file: Path) -> None:
-        """Rotate history file to prevent it from growing too large"""
-        try:
-            # Read recent interactions
-            with open(history_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            # Keep only the most recent interactions
-            keep_lines = lines[-self.history_limit:]
-            
-            # Write back the reduced history
-            with open(history_file, 'w', encoding='utf-8') as f:
-                f.writelines(keep_lines)
-                
-        except Exception as e:
-            logger.error(f"Failed to rotate history file: {e}")
+    def prune_history(self) -> int:
+        """Delete history segments beyond max_segments for users that rolled; returns segments deleted"""
+        with self._flush_lock:
+            pending, self._prune_pending = self._prune_pending, set()
+        pruned = 0
+        for user_id in pending:
+            history_dir = self._get_user_data_path(user_id) / "interactions"
+            segments = sorted(history_dir.glob('[0-9]*.jsonl'))
+            for segment in segments[:max(0, len(segments) - self.max_segments)]:
+                try:
+                    segment.unlink()
+                    pruned += 1
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error(f"Failed to prune history segment {segment}: {e}")
+        self.history_stats['segments_pruned'] += pruned
+        return pruned
     
     def _save_user_preferences(self, avatar_name: str, user_id: str, preferences: UserPreferences) -> None:
-        """Save user preferences to disk"""
-        try:
-            user_dir = self._get_user_data_path(user_id)
-            user_dir.mkdir(parents=True, exist_ok=True)
-            
-            prefs_file = user_dir / "preferences.json"
-            
-            # Load existing preferences
-            all_prefs = {}
-            if prefs_file.exists():
-                with open(prefs_file, 'r', encoding='utf-8') as f:
-                    all_prefs = json.load(f)
+        """Mark user preferences for the next flush; they are already current in memory"""
+        with self._flush_lock:
+            self._dirty_preferences.add((user_id, avatar_name))
+    
+    def flush_preferences(self) -> int:
+        """
+        Write every dirty pair's preferences to disk; returns the number of pairs written
+
+        Pairs are grouped per user so each preferences.json is rewritten once,
+        through a temporary file and an atomic rename. Pairs whose write
+        failed stay dirty for the next flush.
+        """
+        # One flush at a time: a slow writer must not be overtaken by an older snapshot
+        with self._write_lock:
+            with self._flush_lock:
+                dirty, self._dirty_preferences = self._dirty_preferences, set()
+                by_user: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+                for user_id, avatar_name in dirty:
+                    prefs = self.user_preferences.get(self._get_user_avatar_key(avatar_name, user_id))
+                    if prefs is not None:
+                        by_user[user_id][avatar_name] = prefs.to_dict()
+            if not by_user:
+                return 0
             
-            # Update with new preferences
-            all_prefs[avatar_name] = preferences.to_dict()
+            started = time.monotonic()
+            written = 0
+            for user_id, updates in by_user.items():
+                try:
+                    self._write_preferences_file(user_id, updates)
+                    written += len(updates)
+                    self.flush_stats['files_written'] += 1
+                except Exception as e:
+                    logger.error(f"Failed to save user preferences: {e}", exc_info=True)
+                    self.flush_stats['failures'] += 1
+                    with self._flush_lock:
+                        self._dirty_preferences.update((user_id, avatar_name) for avatar_name in updates)
             
-            # Save back to disk
-            with open(prefs_file, 'w', encoding='utf-8') as f:
-                json.dump(all_prefs, f, indent=2)
-                
-        except Exception as e:
-            logger.error(f"Failed to save user preferences: {e}", exc_info=True)
+            elapsed_ms = (time.monotonic() - started) * 1000
+            self.flush_stats['flushes'] += 1
+            self.flush_stats['pairs_written'] += written
+            self.flush_stats['last_flush_ms'] = round(elapsed_ms, 2)
+            self.flush_stats['max_flush_ms'] = round(max(self.flush_stats['max_flush_ms'], elapsed_ms), 2)
+            return written
+    
+    def _write_preferences_file(self, user_id: str, updates: Dict[str, Dict[str, Any]]) -> None:
+        """Merge updates into the user's preferences.json and replace it atomically"""
+        user_dir = self._get_user_data_path(user_id)
+        user_dir.mkdir(parents=True, exist_ok=True)
+        prefs_file = user_dir / "preferences.json"
+        
+        # Keep avatars this process has not loaded
+        all_prefs = {}
+        if prefs_file.exists():
+            with open(prefs_file, 'r', encoding='utf-8') as f:
+                all_prefs = json.load(f)
+        all_prefs.update(updates)
+        
+        tmp = prefs_file.with_name(f".preferences.json.{os.getpid()}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(all_prefs, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, prefs_file)
+    
+    def _flush_loop(self) -> None:
+        while not self._closing.wait(self.flush_interval):
+            self.flush_preferences()
+            self.flush_indexes()
+            self.prune_history()
+    
+    def close(self) -> None:
+        """Stop the background flusher, write out anything still dirty and prune history"""
+        # Otherwise the interpreter keeps every engine alive until exit and
+        # closes it again, long after its data_dir may have been removed
+        atexit.unregister(self.close)
+        self._closing.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self.flush_preferences()
+        self.flush_indexes()
+        self.prune_history()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Loaded pairs, history segment and preference write-behind counters"""
+        with self._flush_lock:
+            dirty = len(self._dirty_preferences)
+            prune_pending = len(self._prune_pending)
+            dirty_indexes = len(self._dirty_indexes)
+        return {
+            'pairs_loaded': len(self._loaded_pairs),
+            'history': {
+                **self.history_stats,
+                'prune_pending': prune_pending,
+                'dirty_indexes': dirty_indexes,
+                'segment_bytes': self.segment_bytes,
+                'max_segments': self.max_segments
+            },
+            'preferences': {
+                **self.flush_stats,
+                'dirty': dirty,
+                'flush_interval': self.flush_interval
+            }
+        }
     
     def record_interaction(self, avatar_name: str, user_id: str, interaction_data: Dict) -> None:
         """
@@ -255,7 +632,7 @@ class AvatarLearningEngine:
             )
             
             # Add to in-memory history
-            key = self._get_user_avatar_key(avatar_name, user_id)
+            key = self._ensure_loaded(avatar_name, user_id)
             self.interaction_history[key].append(interaction)
             
             # Enforce history limit
@@ -275,70 +652,233 @@ class AvatarLearningEngine:
     
     def _update_user_preferences(self, avatar_name: str, user_id: str, interaction: InteractionRecord) -> None:
         """Update user preferences based on interaction"""
+        key = self._ensure_loaded(avatar_name, user_id)
+        self.preference_stats[key].update(interaction, self.thresholds)
+        self._apply_preference_stats(avatar_name, user_id)
+    
+    def _apply_preference_stats(self, avatar_name: str, user_id: str, force_save: bool = False) -> None:
+        """Derive the pair's preferences from its statistics, saving them if they changed"""
         key = self._get_user_avatar_key(avatar_name, user_id)
-        interactions = self.interaction_history[key]
+        stats = self.preference_stats[key]
         
         # Need minimum interactions before updating preferences
-        if len(interactions) < self.min_interactions_for_learning:
+        if stats.interactions < self.min_interactions_for_learning:
             return
         
         # Get or create preferences
         if key not in self.user_preferences:
             self.user_preferences[key] = UserPreferences()
+            force_save = True
         
         prefs = self.user_preferences[key]
+        before = prefs.to_dict()
+        stats.apply(prefs, self.thresholds)
         
-        # Analyze response length preference
-        response_lengths = [
-            len(ia.avatar_response.split()) 
-            for ia in interactions[-self.min_interactions_for_learning:]
-            if ia.satisfaction_score > 0.5  # Only consider positive interactions
-        ]
+        if force_save or prefs.to_dict() != before:
+            self._save_user_preferences(avatar_name, user_id, prefs)
+    
+    def recompute_preferences(self, avatar_name: str, user_id: str) -> Dict[str, Any]:
+        """
+        Rebuild a pair's statistics from its retained history and re-derive its preferences
+
+        Used after changing thresholds, and by the nightly recompute.
+        """
+        key = self._ensure_loaded(avatar_name, user_id)
+        self.preference_stats[key] = PreferenceStats.from_history(self.interaction_history.get(key, []), self.thresholds)
+        self._apply_preference_stats(avatar_name, user_id, force_save=True)
+        return self.user_preferences[key].to_dict() if key in self.user_preferences else {}
+    
+    def recompute_all_preferences(self) -> int:
+        """
+        Recompute every pair in the user indexes from its retained history; returns the number of pairs
+
+        Pairs this engine has loaded are recomputed in place. The others are
+        read, recomputed and written back one user at a time without being
+        loaded, so a nightly run does not leave every history resident.
+        """
+        pairs = 0
+        for user_id in self._stored_user_ids():
+            index = self._get_user_index(user_id)
+            segments, stored, updates = None, None, {}
+            for avatar_name, entry in list(index['avatars'].items()):
+                pairs += 1
+                if self._get_user_avatar_key(avatar_name, user_id) in self._loaded_pairs:
+                    self.recompute_preferences(avatar_name, user_id)
+                    continue
+                if segments is None:
+                    segments = self._history_segments(user_id)
+                history = self._read_recent_interactions(
+                    segments, avatar_name, user_id, min(entry.get('interactions', 0), self.history_limit)
+                )
+                stats = PreferenceStats.from_history(history, self.thresholds)
+                if stats.interactions < self.min_interactions_for_learning:
+                    continue
+                if stored is None:
+                    prefs_file = self._get_user_data_path(user_id) / "preferences.json"
+                    stored = {}
+                    if prefs_file.exists():
+                        with open(prefs_file, 'r', encoding='utf-8') as f:
+                            stored = json.load(f)
+                prefs = UserPreferences.from_dict(stored.get(avatar_name, {}))
+                stats.apply(prefs, self.thresholds)
+                updates[avatar_name] = prefs.to_dict()
+            if updates:
+                try:
+                    with self._write_lock:
+                        self._write_preferences_file(user_id, updates)
+                except Exception as e:
+                    logger.error(f"Failed to write recomputed preferences for {user_id}: {e}", exc_info=True)
+        logger.info(f"Recomputed preferences for {pairs} user-avatar pairs")
+        return pairs
+    
+    def _stored_user_ids(self) -> Iterator[str]:
+        """
+        The user id behind every directory under data_dir
+
+        The id is read from index.json, or for a directory written before
+        the index existed (or with a corrupt one) from its history, so
+        _get_user_index can then build the index.
+        """
+        for user_dir in sorted(self.data_dir.iterdir()):
+            if not user_dir.is_dir():
+                continue
+            try:
+                with open(user_dir / "index.json", 'r', encoding='utf-8') as f:
+                    user_id = json.load(f)['user_id']
+            except (OSError, json.JSONDecodeError, KeyError):
+                user_id = self._user_id_from_history(user_dir)
+            if user_id is None:
+                logger.warning(f"Skipping {user_dir}: no index or readable history")
+                continue
+            yield user_id
+    
+    def _user_id_from_history(self, user_dir: Path) -> Optional[str]:
+        """The user id in the first readable history record under user_dir, if it hashes to user_dir"""
+        for path in [*sorted((user_dir / "interactions").glob('[0-9]*.jsonl')), user_dir / "interactions.jsonl"]:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            user_id = json.loads(line)['user_id']
+                        except (json.JSONDecodeError, KeyError, TypeError):
+                            continue
+                        return user_id if self._get_user_data_path(user_id) == user_dir else None
+            except FileNotFoundError:
+                continue
+        return None
+    
+    def load_interaction_columns(self) -> Tuple[List[Tuple[str, str]], Dict[str, np.ndarray]]:
+        """
+        Every retained interaction as columnar arrays, in file order
+
+        Returns the (user_id, avatar_name) pairs and columns 'pair' (index
+        into them), 'satisfaction', 'words', 'technical' and 'emojis'.
+        """
+        pair_ids: Dict[Tuple[str, str], int] = {}
+        pair, satisfaction = array('i'), array('d')
+        words, technical, emojis = array('i'), array('i'), array('i')
+        for user_id in self._stored_user_ids():
+            # Builds the index for directories that predate it
+            self._get_user_index(user_id)
+            for segment in self._history_segments(user_id):
+                try:
+                    with open(segment, 'r', encoding='utf-8') as f:
+                        for line in f:
+                            try:
+                                data = json.loads(line)
+                                key = (data['user_id'], data['avatar_name'])
+                                features = response_features(data['avatar_response'])
+                                score = float(data['satisfaction_score'])
+                            except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                                continue
+                            pair.append(pair_ids.setdefault(key, len(pair_ids)))
+                            satisfaction.append(score)
+                            words.append(features[0])
+                            technical.append(features[1])
+                            emojis.append(features[2])
+                except FileNotFoundError:
+                    continue
         
-        if response_lengths:
-            avg_length = np.mean(response_lengths)
-            if avg_length < 20:
-                prefs.response_length = "brief"
-            elif avg_length > 100:
-                prefs.response_length = "detailed"
-            else:
-                prefs.response_length = "moderate"
-        
-        # Analyze technical depth preference
-        technical_terms = ['algorithm', 'implementation', 'configuration', 'debug', 'optimize']
-        technical_score = sum(
-            sum(1 for term in technical_terms if term in ia.avatar_response.lower())
-            for ia in interactions[-self.min_interactions_for_learning:]
-            if ia.satisfaction_score > 0.5
+        columns = {
+            'pair': np.array(pair, dtype=np.int32),
+            'satisfaction': np.array(satisfaction, dtype=np.float64),
+            'words': np.array(words, dtype=np.int32),
+            'technical': np.array(technical, dtype=np.int32),
+            'emojis': np.array(emojis, dtype=np.int32)
+        }
+        return list(pair_ids), columns
+    
+    def batch_recompute_preferences(self, write: bool = True) -> Dict[str, Any]:
+        """
+        Re-derive every pair's preferences from its stored history in one vectorized pass
+
+        Preferences are written back with one atomic preferences.json
+        rewrite per user; other preference fields and avatars without
+        history are kept. Pairs this engine has loaded are updated in
+        memory too, so a later write-behind flush does not undo the result.
+        """
+        started = time.monotonic()
+        pairs, columns = self.load_interaction_columns()
+        loaded = time.monotonic()
+        stats = compute_preference_columns(
+            columns['pair'], columns['satisfaction'], columns['words'], columns['technical'], columns['emojis'],
+            len(pairs), self.thresholds
         )
+        labels = derive_preference_columns(stats, self.thresholds)
+        computed = time.monotonic()
         
-        if technical_score > 5:
-            prefs.technical_depth = "high"
-        elif technical_score > 2:
-            prefs.technical_depth = "medium"
-        else:
-            prefs.technical_depth = "low"
-        
-        # Analyze emoji usage preference
-        emoji_pattern = re.compile(
-            r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF]'
-        )
+        updates: DefaultDict[str, Dict[str, Dict[str, str]]] = defaultdict(dict)
+        for n, (user_id, avatar_name) in enumerate(pairs):
+            if stats['interactions'][n] < self.min_interactions_for_learning:
+                continue
+            if stats['positive'][n]:
+                fields = {name: str(values[n]) for name, values in labels.items()}
+            else:
+                fields = {'technical_depth': 'low', 'emoji_usage': 'minimal'}
+            updates[user_id][avatar_name] = fields
         
-        emoji_counts = [
-            len(emoji_pattern.findall(ia.avatar_response))
-            for ia in interactions[-self.min_interactions_for_learning:]
-            if ia.satisfaction_score > 0.5
-        ]
+        if write:
+            for user_id, avatars in updates.items():
+                try:
+                    self._write_preference_fields(user_id, avatars)
+                except Exception as e:
+                    logger.error(f"Failed to write recomputed preferences for {user_id}: {e}", exc_info=True)
+        written = time.monotonic()
         
-        if emoji_counts and np.mean(emoji_counts) > 3:
-            prefs.emoji_usage = "frequent"
-        elif emoji_counts and np.mean(emoji_counts) > 0:
-            prefs.emoji_usage = "moderate"
-        else:
-            prefs.emoji_usage = "minimal"
+        result = {
+            'interactions': int(len(columns['pair'])),
+            'pairs': len(pairs),
+            'updated': sum(len(avatars) for avatars in updates.values()),
+            'load_seconds': round(loaded - started, 3),
+            'compute_seconds': round(computed - loaded, 3),
+            'write_seconds': round(written - computed, 3)
+        }
+        logger.info(f"Batch recompute: {result}")
+        return result
+    
+    def _write_preference_fields(self, user_id: str, avatars: Dict[str, Dict[str, str]]) -> None:
+        """Overlay recomputed fields on a user's stored and in-memory preferences, then write them"""
+        user_dir = self._get_user_data_path(user_id)
+        prefs_file = user_dir / "preferences.json"
+        stored = {}
+        if prefs_file.exists():
+            with open(prefs_file, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
         
-        # Save updated preferences
-        self._save_user_preferences(avatar_name, user_id, prefs)
+        full = {}
+        with self._flush_lock:
+            for avatar_name, fields in avatars.items():
+                key = self._get_user_avatar_key(avatar_name, user_id)
+                prefs = self.user_preferences.get(key)
+                if prefs is None:
+                    prefs = UserPreferences.from_dict(stored.get(avatar_name, {}))
+                    if key in self._loaded_pairs:
+                        self.user_preferences[key] = prefs
+                for name, value in fields.items():
+                    setattr(prefs, name, value)
+                full[avatar_name] = prefs.to_dict()
+        with self._write_lock:
+            self._write_preferences_file(user_id, full)
     
     def analyze_user_preferences(self, avatar_name: str, user_id: str) -> Dict[str, Any]:
         """
@@ -347,18 +887,13 @@ class AvatarLearningEngine:
         Returns:
             Dictionary containing learned preferences
         """
-        key = self._get_user_avatar_key(avatar_name, user_id)
+        key = self._ensure_loaded(avatar_name, user_id)
         
         if key in self.user_preferences:
             return self.user_preferences[key].to_dict()
         
-        # Fallback to analyzing interactions if no prefs exist yet
-        interactions = self.interaction_history.get(key, [])
-        if len(interactions) < self.min_interactions_for_learning:
-            return {}
-        
-        # This will trigger preference analysis and return the result
-        self._update_user_preferences(avatar_name, user_id, interactions[-1])
+        # Fallback to the running statistics if no prefs exist yet
+        self._apply_preference_stats(avatar_name, user_id)
         return self.user_preferences[key].to_dict() if key in self.user_preferences else {}
     
     def generate_personalized_system_prompt(
@@ -516,8 +1051,188 @@ class AvatarLearningEngine:
                 'timestamp': datetime.utcnow().isoformat()
             }
 
+PREFERENCE_LABELS = {
+    'response_length': np.array(['brief', 'moderate', 'detailed']),
+    'technical_depth': np.array(['low', 'medium', 'high']),
+    'emoji_usage': np.array(['minimal', 'moderate', 'frequent'])
+}
+
+def compute_preference_columns(
+    pair: np.ndarray,
+    satisfaction: np.ndarray,
+    words: np.ndarray,
+    technical: np.ndarray,
+    emojis: np.ndarray,
+    n_pairs: int,
+    thresholds: PreferenceThresholds
+) -> Dict[str, np.ndarray]:
+    """
+    PreferenceStats for every pair at once from columnar interactions
+
+    Rows must be in chronological order within each pair. An EWMA seeded
+    with its first sample is a weighted sum: the k-th of a pair's n
+    positive interactions carries alpha * (1 - alpha) ** (n - 1 - k),
+    except the first, which carries (1 - alpha) ** (n - 1). Weights are
+    computed per row and summed per pair with bincount. Results agree with
+    PreferenceStats.update() to floating-point rounding.
+    """
+    alpha = thresholds.alpha
+    interactions = np.bincount(pair, minlength=n_pairs)
+    
+    positive = satisfaction > thresholds.positive_satisfaction
+    pos_pair = pair[positive]
+    order = np.argsort(pos_pair, kind='stable')
+    pos_pair = pos_pair[order]
+    positives = np.bincount(pos_pair, minlength=n_pairs)
+    
+    # Rank of each row within its pair, and how many rows come after it
+    run_starts = np.flatnonzero(np.r_[True, pos_pair[1:] != pos_pair[:-1]]) if len(pos_pair) else np.empty(0, dtype=np.int64)
+    run_lengths = np.diff(np.r_[run_starts, len(pos_pair)])
+    rank = np.arange(len(pos_pair)) - np.repeat(run_starts, run_lengths)
+    after = np.repeat(run_lengths, run_lengths) - 1 - rank
+    weights = np.power(1.0 - alpha, after)
+    weights[rank > 0] *= alpha
+    
+    columns = {'interactions': interactions, 'positive': positives}
+    for name, values in (('response_words', words), ('technical_terms', technical), ('emojis', emojis)):
+        columns[name] = np.bincount(pos_pair, weights=weights * values[positive][order], minlength=n_pairs)
+    return columns
+
+def derive_preference_columns(columns: Dict[str, np.ndarray], thresholds: PreferenceThresholds) -> Dict[str, np.ndarray]:
+    """The labels PreferenceStats.apply() would choose, for every pair at once"""
+    words, technical, emojis = columns['response_words'], columns['technical_terms'], columns['emojis']
+    return {
+        'response_length': PREFERENCE_LABELS['response_length'][
+            np.where(words < thresholds.brief_words, 0, np.where(words > thresholds.detailed_words, 2, 1))
+        ],
+        'technical_depth': PREFERENCE_LABELS['technical_depth'][
+            np.where(technical > thresholds.technical_high, 2, np.where(technical > thresholds.technical_medium, 1, 0))
+        ],
+        'emoji_usage': PREFERENCE_LABELS['emoji_usage'][
+            np.where(emojis > thresholds.emoji_frequent, 2, np.where(emojis > thresholds.emoji_moderate, 1, 0))
+        ]
+    }
+
+def run_batch_benchmark(rows: int = 10_000_000, pairs: int = 100_000, check_pairs: int = 2000, seed: int = 7) -> bool:
+    """Time the vectorized recompute on a synthetic corpus and check it against per-interaction replay"""
+    rng = np.random.default_rng(seed)
+    thresholds = PreferenceThresholds()
+    pair = rng.integers(0, pairs, rows, dtype=np.int32)
+    satisfaction = rng.uniform(-1, 1, rows).round(2)
+    words = rng.integers(1, 200, rows, dtype=np.int32)
+    technical = rng.binomial(len(TECHNICAL_TERMS), 0.1, rows).astype(np.int8)
+    emojis = np.where(rng.random(rows) < 0.2, rng.integers(1, 6, rows), 0).astype(np.int16)
+    
+    started = time.monotonic()
+    columns = compute_preference_columns(pair, satisfaction, words, technical, emojis, pairs, thresholds)
+    labels = derive_preference_columns(columns, thresholds)
+    batch_seconds = time.monotonic() - started
+    
+    # Replay the rows of a sample of pairs one by one, as record_interaction would
+    stats = {n: PreferenceStats() for n in range(check_pairs)}
+    in_sample = np.flatnonzero(pair < check_pairs)
+    started = time.monotonic()
+    for p, sat, w, t, e in zip(pair[in_sample].tolist(), satisfaction[in_sample].tolist(), words[in_sample].tolist(),
+                               technical[in_sample].tolist(), emojis[in_sample].tolist()):
+        stats[p].update_features(sat, w, t, e, thresholds)
+    replay_seconds = (time.monotonic() - started) * rows / max(1, len(in_sample))
+    
+    mismatches = 0
+    for n, replayed in stats.items():
+        prefs = UserPreferences()
+        replayed.apply(prefs, thresholds)
+        agree = (
+            replayed.interactions == columns['interactions'][n] and replayed.positive == columns['positive'][n]
+            and np.isclose(replayed.response_words, columns['response_words'][n], rtol=1e-9)
+            and np.isclose(replayed.technical_terms, columns['technical_terms'][n], rtol=1e-9, atol=1e-12)
+            and np.isclose(replayed.emojis, columns['emojis'][n], rtol=1e-9, atol=1e-12)
+            and (replayed.positive == 0 or (
+                prefs.response_length == labels['response_length'][n]
+                and prefs.technical_depth == labels['technical_depth'][n]
+                and prefs.emoji_usage == labels['emoji_usage'][n]
+            ))
+        )
+        mismatches += not agree
+    
+    print(f"{rows} interactions over {pairs} pairs: vectorized recompute {batch_seconds:.2f}s "
+          f"({rows / batch_seconds / 1e6:.1f}M rows/s), per-interaction replay ~{replay_seconds:.1f}s")
+    print(f"{check_pairs} sampled pairs {'agree ✅' if not mismatches else f'differ for {mismatches} ❌'}")
+    return mismatches == 0
+
+def run_preference_verification(pairs: int = 20, max_interactions: int = 1500, seed: int = 7) -> bool:
+    """
+    Check that the running statistics match a recompute from history
+
+    Records synthetic interactions through a scratch engine, then compares
+    each pair's incremental statistics and preferences with those rebuilt
+    from its retained history, in the same engine and after a fresh
+    engine reloads the pair from disk.
+    """
+    import random
+    import tempfile
+    
+    rng = random.Random(seed)
+    words = ['dharma', 'code', 'path', 'light', 'optimize', 'debug', 'algorithm', 'configuration', 'peace', 'loop']
+    emojis = ['🙏', '🚀', '😊', '🌸']
+    
+    with tempfile.TemporaryDirectory(prefix='kalki-learning-verify-') as tmp:
+        engine = AvatarLearningEngine(tmp)
+        reloaded = None
+        try:
+            for n in range(pairs):
+                user_id, avatar_name = f"user{n}", ('mushak', 'krix', 'shera')[n % 3]
+                for _ in range(rng.randint(1, max_interactions)):
+                    response = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 160)))
+                    response += ''.join(rng.choice(emojis) for _ in range(rng.choice((0, 0, 0, 1, 5))))
+                    engine.record_interaction(avatar_name, user_id, {
+                        'user_input': 'question',
+                        'avatar_response': response,
+                        'satisfaction_score': round(rng.uniform(-1, 1), 2)
+                    })
+            
+            # What close() writes at shutdown, without stopping the engine
+            engine.flush_preferences()
+            engine.flush_indexes()
+            reloaded = AvatarLearningEngine(tmp)
+            mismatches = 0
+            for key, incremental in engine.preference_stats.items():
+                user_id, avatar_name = key.split('::')
+                prefs = dict(engine.analyze_user_preferences(avatar_name, user_id))
+                recomputed = PreferenceStats.from_history(engine.interaction_history[key], engine.thresholds)
+                fresh = reloaded.preference_stats[reloaded._ensure_loaded(avatar_name, user_id)]
+                averages = lambda stats: (stats.response_words, stats.technical_terms, stats.emojis)
+                agree = (
+                    averages(incremental) == averages(recomputed) == averages(fresh)
+                    and prefs == engine.recompute_preferences(avatar_name, user_id)
+                    and prefs == reloaded.analyze_user_preferences(avatar_name, user_id)
+                )
+                if not agree:
+                    mismatches += 1
+                    print(f"{key}: incremental {averages(incremental)} recomputed {averages(recomputed)} reloaded {averages(fresh)}")
+        finally:
+            # While the directory still exists, so nothing is written back into it
+            engine.close()
+            if reloaded is not None:
+                reloaded.close()
+    
+    print(f"{pairs} pairs: incremental and recomputed statistics "
+          f"{'agree ✅' if not mismatches else f'differ for {mismatches} ❌'}")
+    return mismatches == 0
+
 # Example usage
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "verify":
+        sys.exit(0 if run_preference_verification() else 1)
+    if len(sys.argv) > 1 and sys.argv[1] == "recompute":
+        print(f"Recomputed {AvatarLearningEngine().recompute_all_preferences()} user-avatar pairs")
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        print(AvatarLearningEngine().batch_recompute_preferences(write='--dry-run' not in sys.argv))
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "batchbench":
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000_000
+        sys.exit(0 if run_batch_benchmark(count) else 1)
+    
     # Initialize the learning engine
     engine = AvatarLearningEngine()
     
@@ -78,7 +78,8 @@ class GestureService:
             payload = {
                 'avatar': avatar,
                 'input': f'summon {avatar} via gesture',
-                'session_id': f'gesture_{avatar}'
+                'session_id': f'gesture_{avatar}',
+                'priority': 'gesture'
             }
             
             await self.omnet_ws.send(json.dumps(payload))
@@ -8,14 +8,27 @@ import json
 import logging
 import os
 import re
+import threading
+import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field, asdict
-from typing import Dict, List, Optional, Any, Tuple, Set
+from typing import Dict, List, Optional, Any, Tuple, Set, Callable, Awaitable, Iterable
 from pathlib import Path
 
 import ollama
 from pydantic import BaseModel, Field
 
+from context_builder import ContextBuilder
+from context_store import ContextStore
+from inference_scheduler import SchedulerBusy, get_inference_scheduler, load_inference_settings
+from kv_sessions import KVSessionCache
+from model_executor import get_model_executor
+from model_cascade import get_model_cascade
+from response_cache import get_response_cache
+from session_catalog import SessionCatalog
+from session_journal import SessionJournal
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -46,9 +59,14 @@ class ConversationContext:
     user_preferences: Dict[str, Any] = field(default_factory=dict)
     active_tools: Set[str] = field(default_factory=set)
     last_interaction: datetime = field(default_factory=datetime.utcnow)
+    # Rolling summary standing in for conversation_history[:summary_upto]
+    summary: Optional[str] = None
+    summary_upto: int = 0
+    # Leading messages of conversation_history already in the session journal
+    persisted_messages: int = field(default=0, repr=False, compare=False)
 
-    def to_dict(self) -> Dict[str, Any]:
-        """Convert context to dictionary for serialization"""
+    def state_dict(self) -> Dict[str, Any]:
+        """Everything but the conversation history, for journal records"""
         return {
             'avatar_name': self.avatar_name,
             'user_id': self.user_id,
@@ -58,12 +76,21 @@ class ConversationContext:
             'user_preferences': self.user_preferences,
             'active_tools': list(self.active_tools),
             'last_interaction': self.last_interaction.isoformat(),
+            'summary': self.summary,
+            'summary_upto': self.summary_upto
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert context to dictionary for serialization"""
+        return {
+            **self.state_dict(),
             'conversation_history': self.conversation_history
         }
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'ConversationContext':
         """Create context from dictionary"""
+        history = data.get('conversation_history', [])
         return cls(
             avatar_name=data['avatar_name'],
             user_id=data['user_id'],
@@ -73,7 +100,10 @@ class ConversationContext:
             user_preferences=data.get('user_preferences', {}),
             active_tools=set(data.get('active_tools', [])),
             last_interaction=datetime.fromisoformat(data.get('last_interaction', datetime.utcnow().isoformat())),
-            conversation_history=data.get('conversation_history', [])
+            conversation_history=history,
+            summary=data.get('summary'),
+            summary_upto=data.get('summary_upto', 0),
+            persisted_messages=len(history)
         )
 
 class AvatarCommunicationEngine:
@@ -81,8 +111,36 @@ class AvatarCommunicationEngine:
     
     def __init__(self, config_path: str = '/opt/kalki/avatars/enhanced-avatar-config.json'):
         self.config_path = Path(config_path)
-        self.conversation_contexts: Dict[str, ConversationContext] = {}
+        self.session_journal = SessionJournal()
+        self.session_catalog = SessionCatalog.from_settings()
+        # Journal fsyncs and catalog commits run here, off the event loop;
+        # one thread keeps every session's writes in order
+        self.session_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix='kalki-session-io')
+        # Evicted contexts whose spill is still queued, so a reload in the
+        # meantime gets them instead of a stale file
+        self._spilling: Dict[Tuple[str, str, str], ConversationContext] = {}
+        if self.session_catalog.count() == 0:
+            # First start with a catalog: index sessions saved before it existed
+            self.session_catalog.rebuild(self.session_journal)
+        # Keyed by (user_id, avatar_name, session_id); evicted contexts are
+        # saved to their session file and reloaded from it on the next turn
+        self.conversation_contexts = ContextStore.from_settings(
+            spill=self._spill_context,
+            load=self._load_context,
+            estimate=self._estimate_context_bytes
+        )
         self.avatar_personalities = self._load_personalities()
+        self.scheduler = get_inference_scheduler()
+        # Blocking Ollama calls run here, not on the loop's default executor
+        self.model_executor = get_model_executor()
+        self.response_cache = get_response_cache()
+        self.cascade = get_model_cascade()
+        self.context_builder = ContextBuilder.from_settings()
+        self.kv_sessions = KVSessionCache.from_settings()
+        self._summary_tasks: Dict[Tuple[str, str, str], asyncio.Task] = {}
+        fallback_settings = load_inference_settings().get('fallback') or {}
+        self.first_token_budget = float(fallback_settings.get('first_token_budget_seconds', 8))
+        self.fallback_queue_depth = int(fallback_settings.get('queue_depth', 2))
         self._setup_directories()
         
     def _setup_directories(self) -> None:
@@ -113,7 +171,7 @@ class AvatarCommunicationEngine:
             }
         })
     
-    def _create_system_prompt(self, avatar_name: str, context: ConversationContext) -> str:
+    def _create_system_prompt(self, avatar_name: str, context: ConversationContext, include_mood: bool = True) -> str:
         """Generate contextual system prompt for the avatar"""
         avatar_config = self._get_avatar_config(avatar_name)
         
@@ -121,7 +179,7 @@ class AvatarCommunicationEngine:
             f"You are {avatar_config.get('name', avatar_name)}, a dharmic AI avatar in Kalki OS.",
             f"\nPersonality: {avatar_config.get('personality', 'helpful and wise')}",
             f"Specialty: {avatar_config.get('specialty', 'general assistance')}",
-            f"Current mood: {context.mood_state}",
+            *([f"Current mood: {context.mood_state}"] if include_mood else []),
             "\nCore Principles:",
             "- Embody your unique personality in every response",
             "- Provide specialized knowledge in your domain",
@@ -215,7 +273,7 @@ class AvatarCommunicationEngine:
         try:
             # Generate or validate session ID
             session_id = session_id or f"{user_id}_{avatar_name}_{int(datetime.utcnow().timestamp())}"
-            context_key = f"{user_id}_{avatar_name}_{session_id}"
+            context_key = (user_id, avatar_name, session_id)
             
             # Get or create conversation context
             context = self.conversation_contexts.get(context_key)
@@ -227,7 +285,7 @@ class AvatarCommunicationEngine:
                     conversation_history=[],
                     mood_state="neutral"
                 )
-                self.conversation_contexts[context_key] = context
+                self.conversation_contexts.put(context_key, context)
             
             # Update last interaction time
             context.last_interaction = datetime.utcnow()
@@ -250,54 +308,74 @@ class AvatarCommunicationEngine:
             # Get appropriate model
             model_name = await self._get_avatar_model(avatar_name, user_input)
             
-            # Prepare conversation for AI model
-            messages = [
-                {'role': 'system', 'content': system_prompt},
-                *[
-                    {'role': msg['role'], 'content': msg['content']}
-                    for msg in context.conversation_history[-10:]  # Last 5 exchanges
-                    if msg['role'] in ['user', 'assistant']
-                ]
-            ]
+            # Prepare conversation for AI model: as much recent history as
+            # the model's token budget allows, older turns via the summary
+            messages, first_sent = self.context_builder.build(
+                model_name, system_prompt, context.conversation_history,
+                context.summary, context.summary_upto
+            )
+            if first_sent > context.summary_upto:
+                self._schedule_summary(context_key, context, first_sent)
             
-            # Generate response using Ollama
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: ollama.chat(
-                    model=model_name,
-                    messages=messages,
-                    options={
-                        'temperature': 0.7,
-                        'top_p': 0.9,
-                        'max_tokens': 1000
-                    }
-                )
+            # Only the opening turn of a session is cacheable: later turns
+            # depend on the conversation history
+            use_cache = (
+                len(context.conversation_history) == 1
+                and self._get_avatar_config(avatar_name).get('response_cache', True)
             )
+            cached = self.response_cache.lookup(model_name, system_prompt, user_input) if use_cache else None
             
-            avatar_response = response['message']['content']
+            if cached is not None:
+                avatar_response, model_used = cached
+                routing = {'cached': True}
+            else:
+                priority = (metadata or {}).get('priority', 'terminal')
+                budget = float((metadata or {}).get('latency_budget', self.first_token_budget))
+                if self._kv_applies(avatar_name, context):
+                    avatar_response, model_used, routing = await self._generate_kv(
+                        context_key, context, model_name, messages, priority, budget
+                    )
+                else:
+                    avatar_response, model_used, routing = await self._generate_cascaded(
+                        avatar_name, model_name, messages, user_input, priority, budget
+                    )
+                if use_cache and avatar_response:
+                    self.response_cache.put(model_name, system_prompt, user_input, avatar_response, model_used)
             
             # Add avatar response to history
             context.conversation_history.append({
                 'role': 'assistant',
                 'content': avatar_response,
                 'timestamp': datetime.utcnow().isoformat(),
-                'model_used': model_name,
+                'model_used': model_used,
                 'mood': context.mood_state
             })
             
-            # Save session state
-            self._save_session(context)
+            # Save session state; failures are logged and retried next turn
+            await asyncio.wait({self._save_session(context)})
             
             return {
                 'avatar': avatar_name,
                 'response': avatar_response,
                 'mood_state': context.mood_state,
                 'session_id': session_id,
-                'model_used': model_name,
+                'model_used': model_used,
                 'timestamp': datetime.utcnow().isoformat(),
-                'active_tools': list(context.active_tools)
+                'active_tools': list(context.active_tools),
+                # 'cascade' and/or 'fallback': why model_used answered;
+                # 'cached' when a stored reply was reused
+                **routing
             }
             
+        except (SchedulerBusy, TimeoutError) as e:
+            reason = 'busy' if isinstance(e, SchedulerBusy) else 'timeout'
+            logger.warning(f"Conversation with {avatar_name} not served: {reason}")
+            return {
+                'avatar': avatar_name,
+                'response': "The avatars are all in deep meditation right now. Please try again in a moment.",
+                'error': reason,
+                'session_id': session_id or 'unknown'
+            }
         except Exception as e:
             logger.error(f"Error in process_conversation: {e}", exc_info=True)
             return {
@@ -307,35 +385,498 @@ class AvatarCommunicationEngine:
                 'session_id': session_id or 'unknown'
             }
     
-    def _save_session(self, context: ConversationContext) -> None:
-        """Save conversation context to disk"""
+    def _options(self, model_name: str) -> Dict:
+        """
+        Sampling options for a call; num_ctx matches the budget the context
+        builder packed for, so Ollama neither truncates the prompt at its
+        default window nor allocates a larger KV cache than needed
+        """
+        return {
+            'temperature': 0.7,
+            'top_p': 0.9,
+            'max_tokens': 1000,
+            'num_ctx': self.context_builder.budget_for(model_name)
+        }
+    
+    async def _chat(self, model_name: str, messages: List[Dict], priority: str) -> Dict:
+        """
+        Generate a response using Ollama once the scheduler admits it
+        
+        The deadline ends the wait, not the blocking call: its thread runs
+        on until Ollama answers, and the scheduler slot stays taken until
+        it does, so timed-out calls cannot pile up past the model's limit.
+        """
+        deadline = await self.scheduler.acquire(model_name, priority)
+        chatting = self.model_executor.submit(
+            lambda: ollama.chat(
+                model=model_name,
+                messages=messages,
+                options=self._options(model_name)
+            )
+        )
+        self.scheduler.release_when_done(model_name, chatting)
+        try:
+            async with asyncio.timeout_at(deadline):
+                # Shielded: cancelling the executor future would mark it
+                # done, and free the slot, while the thread is still busy
+                return await asyncio.shield(chatting)
+        except TimeoutError:
+            self.scheduler.record_timeout()
+            raise
+    
+    def _kv_applies(self, avatar_name: str, context: ConversationContext) -> bool:
+        """KV reuse covers follow-up turns; opening turns go through the cascade and cache"""
+        return (
+            self.kv_sessions.enabled
+            and len(context.conversation_history) > 1
+            and self._get_avatar_config(avatar_name).get('kv_reuse', True)
+        )
+    
+    async def _generate_kv(
+        self,
+        key: Tuple[str, str, str],
+        context: ConversationContext,
+        model_name: str,
+        messages: List[Dict],
+        priority: str,
+        budget: float
+    ) -> Tuple[str, str, Dict]:
+        """
+        Continue a session from the context Ollama returned last turn,
+        sending only the new user message. Without a usable context (first
+        follow-up, model switch, changed persona, eviction, or a state that
+        would outgrow the budget with the new message) the turn is replayed:
+        the earlier packed turns ride in the system prompt, as the summary
+        does, and the new message goes through the model's template as the
+        user turn, which yields a fresh context for the next turn. A resumed
+        turn sends the stable persona as its system prompt; left empty,
+        Ollama would fall back to the Modelfile's own SYSTEM.
+        
+        The generation is the primary in _chat_with_fallback, so a
+        backlogged or silent model hands the turn to the avatar's fallback
+        like any other; the KV state is then dropped and the next turn
+        replays.
+        """
+        history = context.conversation_history
+        # Keyed on the prompt without its mood line, which changes with
+        # nearly every message; a resumed turn keeps the mood it started with
+        stable_prompt = self._create_system_prompt(context.avatar_name, context, include_mood=False)
+        token_budget = self.context_builder.budget_for(model_name) - self.context_builder.response_reserve
+        kv_context = self.kv_sessions.lookup(
+            key, model_name, stable_prompt, len(history) - 1, token_budget,
+            self.context_builder.count_tokens(stable_prompt) + self.context_builder.message_tokens(history[-1])
+        )
+        if kv_context is not None:
+            system, prompt = stable_prompt, history[-1]['content']
+        else:
+            system = messages[0]['content']
+            if len(messages) > 2:
+                system += "\n\nConversation so far:\n" + '\n\n'.join(
+                    f"{'User' if message['role'] == 'user' else 'Assistant'}: {message['content']}"
+                    for message in messages[1:-1]
+                )
+            prompt = messages[-1]['content']
+        
+        final = {}
+        
+        async def generate(first_token: asyncio.Future) -> Tuple[str, Optional[str]]:
+            content, last = await self._stream(
+                model_name, priority, first_token,
+                lambda: ollama.generate(
+                    model=model_name,
+                    prompt=prompt,
+                    system=system,
+                    context=kv_context,
+                    options=self._options(model_name),
+                    stream=True
+                )
+            )
+            final.update(last)
+            return content, last.get('done_reason')
+        
+        content, _, model_used, fallback = await self._chat_with_fallback(
+            context.avatar_name, model_name, messages, priority, budget, primary=generate
+        )
+        routing = {'kv': {'mode': 'replay' if kv_context is None else 'reuse'}}
+        if fallback is not None:
+            routing['fallback'] = fallback
+        if model_used == model_name:
+            # The stored state covers this turn's user message and the reply
+            self.kv_sessions.store(key, model_name, stable_prompt, len(history) + 1, final.get('context'))
+        else:
+            self.kv_sessions.drop(key)
+        return content, model_used, routing
+    
+    async def _stream_chat(
+        self, model_name: str, messages: List[Dict], priority: str, first_token: asyncio.Future
+    ) -> Tuple[str, Optional[str]]:
+        """Stream a chat response; returns (response, done_reason)"""
+        content, last = await self._stream(
+            model_name, priority, first_token,
+            lambda: ollama.chat(
+                model=model_name,
+                messages=messages,
+                options=self._options(model_name),
+                stream=True
+            )
+        )
+        return content, last.get('done_reason')
+    
+    async def _stream(
+        self, model_name: str, priority: str, first_token: asyncio.Future, open_stream: Callable[[], Iterable[Dict]]
+    ) -> Tuple[str, Dict]:
+        """
+        Run a streaming chat or generate call from the blocking Ollama
+        client in the executor, relaying chunks through a queue, and resolve
+        first_token when the first content arrives. Returns (response, the
+        final chunk), which carries done_reason and, for generate, the new
+        'context'.
+        
+        Cancelling, or the deadline passing, returns at once; the executor
+        thread closes its stream at the next chunk, which makes Ollama stop
+        generating. The scheduler slot is held until that thread has
+        exited, so an abandoned stream still counts against the model's
+        concurrency while it winds down.
+        """
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        
+        def pump():
+            stream = None
+            try:
+                stream = open_stream()
+                for chunk in stream:
+                    if stop.is_set():
+                        return
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+            except Exception as e:
+                if not stop.is_set():
+                    loop.call_soon_threadsafe(chunks.put_nowait, e)
+            finally:
+                # Closing the generator closes the HTTP response
+                if hasattr(stream, 'close'):
+                    stream.close()
+        
+        parts = []
+        last = {}
+        deadline = await self.scheduler.acquire(model_name, priority)
+        pumping = self.model_executor.submit(pump)
+        # The slot is freed when the pump thread exits, not when this caller
+        # stops waiting for it
+        self.scheduler.release_when_done(model_name, pumping)
+        try:
+            while True:
+                async with asyncio.timeout_at(deadline):
+                    chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                delta = chunk['message']['content'] if 'message' in chunk else chunk.get('response', '')
+                if delta:
+                    parts.append(delta)
+                    if not first_token.done():
+                        first_token.set_result(model_name)
+                if chunk.get('done'):
+                    last = chunk
+        except TimeoutError:
+            self.scheduler.record_timeout()
+            raise
+        finally:
+            stop.set()
+        return ''.join(parts), last
+    
+    async def _chat_with_fallback(
+        self,
+        avatar_name: str,
+        model_name: str,
+        messages: List[Dict],
+        priority: str,
+        budget: float,
+        primary: Optional[Callable[[asyncio.Future], Awaitable[Tuple[str, Optional[str]]]]] = None
+    ) -> Tuple[str, Optional[str], str, Optional[Dict]]:
+        """
+        Generate with model_name, falling back to the avatar's model_fallback
+        
+        The fallback takes over outright when model_name already has
+        fallback_queue_depth requests waiting, and is raced against it when
+        model_name has not produced a first token within budget seconds;
+        whichever starts answering first wins and the other is cancelled.
+        primary, if given, generates for model_name in place of a chat
+        stream over messages (the KV path's generate call); it takes the
+        first-token future and returns (response, done_reason). The
+        fallback always chats over messages.
+        
+        Returns (response, done_reason, model that answered, fallback
+        details or None if the primary answered without a race).
+        """
+        loop = asyncio.get_running_loop()
+        fallback = self._get_avatar_config(avatar_name).get('model_fallback')
+        if not fallback or fallback == model_name or budget <= 0:
+            if primary is not None:
+                content, done_reason = await primary(loop.create_future())
+                return content, done_reason, model_name, None
+            response = await self._chat(model_name, messages, priority)
+            return response['message']['content'], response.get('done_reason'), model_name, None
+        
+        if self.scheduler.queue_depth(model_name) >= self.fallback_queue_depth:
+            response = await self._chat(fallback, messages, priority)
+            details = {'primary': model_name, 'reason': 'queue_depth', 'answered_by': fallback}
+            return response['message']['content'], response.get('done_reason'), fallback, details
+        
+        if primary is None:
+            primary = lambda first_token: self._stream_chat(model_name, messages, priority, first_token)
+        primary_first = loop.create_future()
+        leader = asyncio.create_task(primary(primary_first))
+        racing = {leader: (model_name, primary_first)}
         try:
-            session_dir = Path(f"/var/lib/kalki/sessions/{context.user_id}")
-            session_dir.mkdir(parents=True, exist_ok=True)
+            done, _ = await asyncio.wait({leader, primary_first}, timeout=budget, return_when=asyncio.FIRST_COMPLETED)
+            if done:
+                content, done_reason = await leader
+                return content, done_reason, model_name, None
             
-            session_file = session_dir / f"{context.avatar_name}_{context.session_id}.json"
-            with open(session_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'context': context.to_dict(),
-                    'last_updated': datetime.utcnow().isoformat()
-                }, f, indent=2)
-                
+            logger.info(f"{model_name} silent after {budget:.1f}s, racing {fallback}")
+            fallback_first = loop.create_future()
+            backup = asyncio.create_task(self._stream_chat(fallback, messages, priority, fallback_first))
+            racing[backup] = (fallback, fallback_first)
+            while True:
+                waits = set(racing) | {first for _, first in racing.values()}
+                done, _ = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+                # A contender wins by starting to answer, or by finishing cleanly
+                winner = next((
+                    task for task, (_, first) in racing.items()
+                    if first in done or (task in done and task.exception() is None)
+                ), None)
+                if winner is not None:
+                    break
+                # Drop contenders that failed before answering; re-raise once none are left
+                for task in [task for task in racing if task.done()]:
+                    if len(racing) == 1:
+                        await task
+                    del racing[task]
+            
+            for task in racing:
+                if task is not winner:
+                    task.cancel()
+            content, done_reason = await winner
+            answered_by = racing[winner][0]
+            details = {'primary': model_name, 'reason': 'first_token_budget', 'answered_by': answered_by}
+            return content, done_reason, answered_by, details
+        finally:
+            for task in racing:
+                if not task.done():
+                    task.cancel()
+    
+    async def _generate_cascaded(
+        self,
+        avatar_name: str,
+        model_name: str,
+        messages: List[Dict],
+        user_input: str,
+        priority: str,
+        budget: float
+    ) -> Tuple[str, str, Dict]:
+        """
+        Answer with the cascade's small model first, escalating to model_name
+        (with deadline-aware fallback) when the input or the small model's
+        reply calls for it
+        
+        Returns (response, model that answered, routing details keyed
+        'cascade' and/or 'fallback').
+        """
+        cascade = self.cascade
+        routing = {}
+        if cascade.applies_to(model_name) and self._get_avatar_config(avatar_name).get('cascade', True):
+            reason = cascade.route(user_input)
+            if reason is None:
+                started = time.monotonic()
+                response = await self._chat(cascade.small_model, messages, priority)
+                cascade.record_latency('small', (time.monotonic() - started) * 1000)
+                content = response['message']['content']
+                reason = cascade.check(content, response.get('done_reason'))
+                if reason is None:
+                    return content, cascade.small_model, {'cascade': {'tier': 'small'}}
+            routing['cascade'] = {'tier': 'large', 'escalated': reason}
+        
+        started = time.monotonic()
+        content, _, model_used, fallback = await self._chat_with_fallback(
+            avatar_name, model_name, messages, priority, budget
+        )
+        if 'cascade' in routing:
+            cascade.record_latency('large', (time.monotonic() - started) * 1000)
+        if fallback is not None:
+            routing['fallback'] = fallback
+        return content, model_used, routing
+    
+    def _schedule_summary(self, key: Tuple[str, str, str], context: ConversationContext, upto: int) -> None:
+        """Fold history up to upto into the rolling summary in the background"""
+        if key in self._summary_tasks:
+            return
+        task = asyncio.create_task(self._summarize_history(context, upto))
+        self._summary_tasks[key] = task
+        task.add_done_callback(lambda _: self._summary_tasks.pop(key, None))
+    
+    async def _summarize_history(self, context: ConversationContext, upto: int) -> None:
+        """Have the small model extend the summary over history[summary_upto:upto]"""
+        start = context.summary_upto
+        transcript = '\n'.join(
+            f"{message['role']}: {self.context_builder.truncate(message['content'], 300)}"
+            for message in context.conversation_history[start:upto]
+            if message['role'] in ('user', 'assistant')
+        )
+        messages = [
+            {
+                'role': 'system',
+                'content': (
+                    f"You keep a running summary of a conversation between a user and {context.avatar_name}. "
+                    "Merge the new turns into the previous summary. Keep facts, goals, decisions and open "
+                    "questions; stay under 150 words. Reply with the summary only."
+                )
+            },
+            {
+                'role': 'user',
+                'content': f"Previous summary:\n{context.summary or '(none)'}\n\nNew turns:\n{transcript}"
+            }
+        ]
+        try:
+            response = await self._chat(self.cascade.small_model, messages, 'learning')
+        except Exception as e:
+            logger.warning(f"Failed to summarize session {context.session_id}: {e}")
+            return
+        summary = response['message']['content'].strip()
+        # Only move forward, and only if nothing replaced the summary meanwhile
+        if summary and context.summary_upto == start:
+            context.summary = summary
+            context.summary_upto = upto
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Cascade, scheduler and cache counters for this engine"""
+        return {
+            'active_contexts': len(self.conversation_contexts),
+            'contexts': self.conversation_contexts.get_stats(),
+            'kv_reuse': self.kv_sessions.get_stats(),
+            'context_window': {
+                **self.context_builder.get_stats(),
+                'summaries_running': len(self._summary_tasks)
+            },
+            'cascade': self.cascade.get_stats(),
+            'scheduler': self.scheduler.get_stats(),
+            'model_executor': self.model_executor.get_stats(),
+            'response_cache': self.response_cache.get_stats()
+        }
+    
+    @staticmethod
+    def _estimate_context_bytes(context: ConversationContext) -> int:
+        """Rough in-memory size of a context: message text plus per-object overhead"""
+        return 1024 + sum(
+            len(message.get('content', '')) + 400 for message in context.conversation_history
+        )
+    
+    def _spill_context(self, key: Tuple[str, str, str], context: ConversationContext) -> None:
+        """Queue a save of a context the store is evicting"""
+        saving = self._save_session(context)
+        self._spilling[key] = context
+        
+        def spilled(saving: asyncio.Future):
+            # A context whose save failed stays here until it is reloaded
+            # and saved again, rather than being lost with the write
+            if saving.exception() is None and self._spilling.get(key) is context:
+                del self._spilling[key]
+        
+        saving.add_done_callback(spilled)
+    
+    def _load_context(self, key: Tuple[str, str, str]) -> Optional[ConversationContext]:
+        """Reload an evicted context from its session file, or take it back if its spill is still queued"""
+        context = self._spilling.get(key)
+        if context is not None:
+            return context
+        session_data = self._read_session(*key)
+        return None if session_data is None else ConversationContext.from_dict(session_data['context'])
+    
+    def _read_session(self, user_id: str, avatar_name: str, session_id: str) -> Optional[Dict]:
+        """Recover a saved session from its snapshot and journal, or None if there is none"""
+        return self.session_journal.load(user_id, avatar_name, session_id)
+    
+    def _save_session(self, context: ConversationContext) -> asyncio.Future:
+        """
+        Queue the turn's new messages for the session journal; returns the write's future
+
+        What gets written is copied here, on the event loop; the append, the
+        catalog update and any compaction it makes due run on session_io.
+        A failed write is logged and its messages are sent again with the
+        next save.
+        """
+        key = (context.user_id, context.avatar_name, context.session_id)
+        history = context.conversation_history
+        start = min(context.persisted_messages, len(history))
+        # The user's last turn, not the save: a spill on eviction must
+        # not move the session up the recent list
+        last_updated = context.last_interaction.isoformat()
+        state = {**context.state_dict(), 'user_preferences': dict(context.user_preferences)}
+        messages = [dict(message) for message in history[start:]]
+        row = (last_updated, len(history), self.session_catalog.make_title(history))
+        context.persisted_messages = len(history)
+        self.conversation_contexts.mark_clean(key)
+        
+        def write() -> bool:
+            due = self.session_journal.append(*key, state, start, messages, last_updated)
+            self._catalog_session(key, *row)
+            return due
+        
+        def written(saving: asyncio.Future):
+            error = saving.exception()
+            if error is not None:
+                logger.error(f"Failed to save session {context.session_id}: {error}")
+                context.persisted_messages = min(context.persisted_messages, start)
+            elif saving.result():
+                # Snapshot now: it covers every append queued before it
+                session_data = {'context': context.to_dict(), 'last_updated': context.last_interaction.isoformat()}
+                compacting = loop.run_in_executor(self.session_io, self.session_journal.compact, *key, session_data)
+                compacting.add_done_callback(
+                    lambda done: done.exception() and logger.error(
+                        f"Failed to compact session {context.session_id}: {done.exception()}"
+                    )
+                )
+        
+        loop = asyncio.get_running_loop()
+        saving = loop.run_in_executor(self.session_io, write)
+        saving.add_done_callback(written)
+        return saving
+    
+    def _catalog_session(
+        self, key: Tuple[str, str, str], last_updated: str, message_count: int, title: Optional[str]
+    ) -> None:
+        """Update the session's catalog row; the session itself is already saved"""
+        try:
+            self.session_catalog.record(*key, last_updated, message_count, title)
         except Exception as e:
-            logger.error(f"Failed to save session: {e}")
+            # The catalog can be rebuilt from the session files, so don't fail the save
+            logger.warning(f"Failed to catalog session {key[2]}: {e}")
+    
+    async def list_sessions(
+        self, user_id: str, limit: int = 20, cursor: Optional[Tuple[str, str, str]] = None,
+        avatar_name: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """A page of the user's sessions, most recently updated first"""
+        sessions, next_cursor = self.session_catalog.recent(user_id, limit, cursor, avatar_name)
+        return {'sessions': sessions, 'next_cursor': next_cursor}
     
     async def load_session(self, user_id: str, avatar_name: str, session_id: str) -> Optional[Dict]:
         """Load a previously saved conversation session"""
         try:
-            session_file = Path(f"/var/lib/kalki/sessions/{user_id}/{avatar_name}_{session_id}.json")
-            if not session_file.exists():
+            # Behind any queued writes for the session
+            session_data = await asyncio.get_running_loop().run_in_executor(
+                self.session_io, self._read_session, user_id, avatar_name, session_id
+            )
+            if session_data is None:
                 return None
                 
-            with open(session_file, 'r', encoding='utf-8') as f:
-                session_data = json.load(f)
-                
             context = ConversationContext.from_dict(session_data['context'])
-            context_key = f"{user_id}_{avatar_name}_{session_id}"
-            self.conversation_contexts[context_key] = context
+            context_key = (user_id, avatar_name, session_id)
+            self.conversation_contexts.put(context_key, context)
+            self.conversation_contexts.mark_clean(context_key)
             
             return {
                 'session_id': session_id,
@@ -365,12 +906,116 @@ async def example_usage():
     print(f"Mood: {response['mood_state']}")
     print(f"Model used: {response['model_used']}")
 
+def run_kv_benchmark(model: str = 'phi3:mini', turns: int = 20) -> None:
+    """Time to first token per turn: full replay via chat vs. resuming via generate's context"""
+    questions = [f"Tell me one short fact about dharma number {n}." for n in range(turns)]
+    system_prompt = "You are Krix, a dharmic AI avatar in Kalki OS. Answer in one sentence."
+    options = {'temperature': 0, 'num_predict': 48}
+    
+    def first_token(stream) -> Tuple[float, str, Dict]:
+        started = time.monotonic()
+        ttft, parts, last = None, [], {}
+        for chunk in stream:
+            text = chunk['message']['content'] if 'message' in chunk else chunk['response']
+            if text and ttft is None:
+                ttft = time.monotonic() - started
+            parts.append(text)
+            last = chunk
+        return (ttft or 0.0) * 1000, ''.join(parts), last
+    
+    replay_ms, reuse_ms = [], []
+    messages = [{'role': 'system', 'content': system_prompt}]
+    for question in questions:
+        messages.append({'role': 'user', 'content': question})
+        ms, reply, _ = first_token(ollama.chat(model=model, messages=messages, options=options, stream=True))
+        messages.append({'role': 'assistant', 'content': reply})
+        replay_ms.append(ms)
+    
+    kv_context = None
+    for question in questions:
+        ms, _, last = first_token(ollama.generate(
+            model=model, prompt=question, system=system_prompt,
+            context=kv_context, options=options, stream=True
+        ))
+        kv_context = last.get('context')
+        reuse_ms.append(ms)
+    
+    print(f"{model}, {turns} turns, time to first token (ms)")
+    print(" turn   replay    reuse")
+    for turn, (replay, reuse) in enumerate(zip(replay_ms, reuse_ms), 1):
+        print(f"{turn:>5} {replay:>8.0f} {reuse:>8.0f}")
+    print(f" mean {sum(replay_ms) / turns:>8.0f} {sum(reuse_ms) / turns:>8.0f}")
+
+async def run_kv_check() -> bool:
+    """
+    Drive three follow-up turns through the KV path against a stand-in for
+    the Ollama client and check what each one sends: a replay, a resumed
+    turn, and a message too large to resume with
+    """
+    engine = AvatarCommunicationEngine()
+    engine.kv_sessions.enabled = True
+    model = 'phi3:mini'
+    budget = engine.context_builder.budget_for(model) - engine.context_builder.response_reserve
+    sent = []
+    
+    def fake_generate(model, prompt='', system=None, context=None, options=None, stream=False, **kwargs):
+        sent.append({'system': system, 'prompt': prompt, 'context': context})
+        # Ollama templates system and prompt on top of the context it is given
+        tokens = list(context or []) + [0] * engine.context_builder.count_tokens((system or '') + prompt)
+        yield {'response': 'As dharma wills.', 'done': True, 'done_reason': 'stop', 'context': tokens}
+    
+    def fake_chat(*args, **kwargs):
+        raise RuntimeError("the KV path should not fall back to chat")
+    
+    context = ConversationContext(avatar_name='mushak', user_id='kvcheck', session_id='kvcheck')
+    context.conversation_history = [
+        {'role': 'user', 'content': 'Namaste, Mushak.'},
+        {'role': 'assistant', 'content': 'Namaste. What obstacle shall we remove today?'}
+    ]
+    key = (context.user_id, context.avatar_name, context.session_id)
+    stable_prompt = engine._create_system_prompt(context.avatar_name, context, include_mood=False)
+    large = 'dharma ' * (budget * 4)
+    modes = []
+    
+    real_generate, real_chat = ollama.generate, ollama.chat
+    ollama.generate, ollama.chat = fake_generate, fake_chat
+    try:
+        for user_input in ['Why does my loop never end?', 'And how do I break out of it?', large]:
+            context.conversation_history.append({'role': 'user', 'content': user_input})
+            messages, _ = engine.context_builder.build(
+                model, engine._create_system_prompt(context.avatar_name, context), context.conversation_history
+            )
+            content, _, routing = await engine._generate_kv(key, context, model, messages, 'terminal', 0)
+            context.conversation_history.append({'role': 'assistant', 'content': content})
+            modes.append(routing['kv']['mode'])
+    finally:
+        ollama.generate, ollama.chat = real_generate, real_chat
+    
+    checks = {
+        'first follow-up replays': modes[0] == 'replay' and sent[0]['context'] is None,
+        'second follow-up resumes': modes[1] == 'reuse' and sent[1]['context'] is not None,
+        'resumed turn keeps the avatar persona': sent[1]['system'] == stable_prompt,
+        'resumed turn sends only the new message': sent[1]['prompt'] == 'And how do I break out of it?',
+        'oversized message replays': modes[2] == 'replay' and sent[2]['context'] is None,
+        'replayed message fits the budget': len(sent[2]['prompt']) < len(large)
+    }
+    for name, passed in checks.items():
+        print(f"{'PASS' if passed else 'FAIL'}  {name}")
+    print(f"{sum(checks.values())}/{len(checks)} checks passed")
+    return all(checks.values())
+
 if __name__ == "__main__":
     import sys
     
     if len(sys.argv) > 1 and sys.argv[1] == "test":
         asyncio.run(example_usage())
+    elif len(sys.argv) > 1 and sys.argv[1] == "kvbench":
+        run_kv_benchmark(*sys.argv[2:3], *[int(n) for n in sys.argv[3:4]])
+    elif len(sys.argv) > 1 and sys.argv[1] == "kvcheck":
+        sys.exit(0 if asyncio.run(run_kv_check()) else 1)
     else:
         print("Avatar Communication Engine")
-        print("Run with 'test' argument to see an example conversation.")
+        print("Run with 'test' argument to see an example conversation,")
+        print("'kvbench [model] [turns]' to compare time to first token with and without KV reuse,")
+        print("or 'kvcheck' to check what KV turns send, against a stand-in for Ollama.")
         print("This module is designed to be imported and used by other components.")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Context Builder - Pack conversation history into a per-model token budget
+Newest turns go in whole; older ones are represented by a rolling summary
+"""
+
+import math
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from inference_scheduler import INFERENCE_SETTINGS_FILE, load_inference_settings
+
+# Typical for the Llama/Mistral/Phi tokenizers on English text and code;
+# slightly pessimistic so estimates err towards fitting
+CHARS_PER_TOKEN = 3.5
+MESSAGE_OVERHEAD_TOKENS = 4  # role markers and separators per message
+TRUNCATION_MARKER = '\n...[truncated]...\n'
+
+class ContextBuilder:
+    """
+    Builds the message list for a model call.
+
+    Each message's token count is estimated once and cached on the message
+    under 'tokens'. The budget for history is the model's context budget
+    minus the system prompt, the rolling summary and response_reserve
+    tokens for the reply. History is packed newest first; the newest user
+    message always goes in, cut down to its head and tail if it alone would
+    overflow (a pasted log, say), and is guaranteed up to half the budget:
+    an oversized summary or system prompt is cut down before it is.
+    Messages before the summary's coverage are never sent, and the caller
+    is told where packing stopped so it can extend the summary over turns
+    that no longer fit.
+    """
+
+    def __init__(
+        self,
+        default_budget: int = 2048,
+        model_budgets: Optional[Dict[str, int]] = None,
+        response_reserve: int = 512
+    ):
+        self.default_budget = default_budget
+        self.model_budgets = dict(model_budgets or {})
+        self.response_reserve = response_reserve
+        self.stats = {
+            'builds': 0, 'messages_sent': 0, 'tokens_sent': 0, 'messages_dropped': 0,
+            'truncated_inputs': 0, 'trimmed_prompts': 0
+        }
+
+    @classmethod
+    def from_settings(cls, settings_file: Path = INFERENCE_SETTINGS_FILE) -> 'ContextBuilder':
+        """Build from the 'context_window' block of inference-settings.yaml"""
+        settings = load_inference_settings(settings_file).get('context_window') or {}
+        return cls(
+            default_budget=int(settings.get('default_budget', 2048)),
+            model_budgets=settings.get('model_budgets') or {},
+            response_reserve=int(settings.get('response_reserve', 512))
+        )
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        return MESSAGE_OVERHEAD_TOKENS + math.ceil(len(text) / CHARS_PER_TOKEN)
+
+    def message_tokens(self, message: Dict) -> int:
+        """Token estimate for a history message, computed once and cached on it"""
+        tokens = message.get('tokens')
+        if tokens is None:
+            tokens = message['tokens'] = self.count_tokens(message['content'])
+        return tokens
+
+    def budget_for(self, model: str) -> int:
+        return int(self.model_budgets.get(model, self.default_budget))
+
+    def truncate(self, text: str, tokens: int) -> str:
+        """Keep the head and tail of text within roughly tokens tokens"""
+        keep = max(0, int((tokens - MESSAGE_OVERHEAD_TOKENS) * CHARS_PER_TOKEN) - len(TRUNCATION_MARKER))
+        if len(text) <= keep:
+            return text
+        head = keep // 2
+        return text[:head] + TRUNCATION_MARKER + text[len(text) - (keep - head):]
+
+    def build(
+        self,
+        model: str,
+        system_prompt: str,
+        history: List[Dict],
+        summary: Optional[str] = None,
+        start: int = 0
+    ) -> Tuple[List[Dict], int]:
+        """
+        Return (messages for the model, index of the oldest history message sent)
+
+        start is the first history index not covered by summary. Anything
+        between start and the returned index was dropped for lack of room.
+        """
+        budget = self.budget_for(model) - self.response_reserve
+        # The newest message is owed all of itself or half the budget,
+        # whichever is less; the summary and then the system prompt are cut
+        # down to make room for it
+        floor = 0
+        for index in range(len(history) - 1, start - 1, -1):
+            if history[index]['role'] in ('user', 'assistant'):
+                floor = min(self.message_tokens(history[index]), budget // 2)
+                break
+        system = system_prompt
+        if summary:
+            room = budget - floor - self.count_tokens(system_prompt)
+            if room > 2 * MESSAGE_OVERHEAD_TOKENS:
+                if self.count_tokens(summary) > room:
+                    self.stats['trimmed_prompts'] += 1
+                    summary = self.truncate(summary, room)
+                system += f"\n\nSummary of the earlier conversation:\n{summary}"
+            else:
+                self.stats['trimmed_prompts'] += 1
+        if self.count_tokens(system) > budget - floor:
+            self.stats['trimmed_prompts'] += 1
+            system = self.truncate(system, budget - floor)
+        remaining = budget - self.count_tokens(system)
+
+        packed = []
+        first = len(history)
+        for index in range(len(history) - 1, start - 1, -1):
+            message = history[index]
+            if message['role'] not in ('user', 'assistant'):
+                continue
+            tokens = self.message_tokens(message)
+            if tokens > remaining:
+                if packed:
+                    break
+                # The newest message alone is over budget: send what fits of it
+                self.stats['truncated_inputs'] += 1
+                tokens = max(remaining, MESSAGE_OVERHEAD_TOKENS)
+                packed.append({'role': message['role'], 'content': self.truncate(message['content'], tokens)})
+            else:
+                packed.append({'role': message['role'], 'content': message['content']})
+            remaining -= tokens
+            first = index
+
+        self.stats['builds'] += 1
+        self.stats['messages_sent'] += len(packed)
+        self.stats['messages_dropped'] += first - start
+        self.stats['tokens_sent'] += budget - remaining
+        return [{'role': 'system', 'content': system}, *reversed(packed)], first
+
+    def get_stats(self) -> Dict:
+        builds = self.stats['builds']
+        return {
+            **self.stats,
+            'avg_tokens_sent': round(self.stats['tokens_sent'] / builds, 1) if builds else 0.0
+        }
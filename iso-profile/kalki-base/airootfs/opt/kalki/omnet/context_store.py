@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Context Store - Bounded in-memory home for conversation contexts
+LRU eviction with an idle TTL; evicted contexts spill to disk and reload lazily
+"""
+
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from inference_scheduler import INFERENCE_SETTINGS_FILE, load_inference_settings
+
+class ContextStore:
+    """
+    Holds at most max_contexts contexts, least recently used first.
+
+    Contexts idle for idle_ttl seconds, and the least recently used ones once
+    the store is full, are evicted. An evicted context that changed since it
+    was last persisted is handed to spill() first; a later get() for it calls
+    load() to bring it back from disk. Contexts handed out by get() or put()
+    are assumed modified until the owner calls mark_clean() after saving.
+    """
+
+    def __init__(
+        self,
+        max_contexts: int = 10000,
+        idle_ttl: float = 3600,
+        spill: Optional[Callable[[Hashable, Any], None]] = None,
+        load: Optional[Callable[[Hashable], Optional[Any]]] = None,
+        estimate: Callable[[Any], int] = sys.getsizeof
+    ):
+        self.max_contexts = max_contexts
+        self.idle_ttl = idle_ttl
+        self.spill = spill
+        self.load = load
+        self.estimate = estimate
+        self.entries: OrderedDict = OrderedDict()  # key -> (last_access, context)
+        self.dirty = set()
+        self.stats = {'hits': 0, 'reloads': 0, 'misses': 0, 'evicted_lru': 0, 'evicted_idle': 0, 'spilled': 0, 'spill_failures': 0}
+
+    @classmethod
+    def from_settings(cls, settings_file=INFERENCE_SETTINGS_FILE, **callbacks) -> 'ContextStore':
+        """Build a store from the 'context_store' block of inference-settings.yaml"""
+        settings = load_inference_settings(settings_file).get('context_store') or {}
+        return cls(
+            max_contexts=int(settings.get('max_contexts', 10000)),
+            idle_ttl=float(settings.get('idle_ttl_seconds', 3600)),
+            **callbacks
+        )
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a context, reloading it from disk if it was evicted"""
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.stats['hits'] += 1
+            self.entries[key] = (now, entry[1])
+            self.entries.move_to_end(key)
+            self.dirty.add(key)
+            return entry[1]
+
+        context = self.load(key) if self.load is not None else None
+        if context is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['reloads'] += 1
+        self.put(key, context)
+        return context
+
+    def put(self, key: Hashable, context: Any):
+        """Insert or replace a context, evicting idle and excess ones"""
+        self.entries[key] = (time.monotonic(), context)
+        self.entries.move_to_end(key)
+        self.dirty.add(key)
+        self._evict()
+
+    def mark_clean(self, key: Hashable):
+        """Record that the context under key has been persisted"""
+        self.dirty.discard(key)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _evict(self):
+        # Entries are in access order, so idle ones are always at the front
+        cutoff = time.monotonic() - self.idle_ttl
+        while self.entries:
+            key, (last_access, _) = next(iter(self.entries.items()))
+            if last_access > cutoff and len(self.entries) <= self.max_contexts:
+                break
+            self._drop(key, 'evicted_idle' if last_access <= cutoff else 'evicted_lru')
+
+    def _drop(self, key: Hashable, reason: str):
+        _, context = self.entries.pop(key)
+        self.stats[reason] += 1
+        if key in self.dirty:
+            self.dirty.discard(key)
+            if self.spill is None:
+                return
+            try:
+                self.spill(key, context)
+                self.stats['spilled'] += 1
+            except Exception:
+                self.stats['spill_failures'] += 1
+
+    def memory_footprint(self) -> Dict:
+        """Estimated bytes held by resident contexts plus process RSS"""
+        estimated = sum(self.estimate(context) for _, context in self.entries.values())
+        return {
+            'estimated_bytes': estimated,
+            'avg_context_bytes': estimated // len(self.entries) if self.entries else 0,
+            'rss_bytes': process_rss_bytes()
+        }
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            'resident': len(self.entries),
+            'dirty': len(self.dirty),
+            'max_contexts': self.max_contexts,
+            **self.memory_footprint()
+        }
+
+def process_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def run_soak(sessions: int = 100000, max_contexts: int = 10000, turns: int = 3) -> bool:
+    """Push synthetic sessions through a store and check memory stays bounded"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory(prefix='kalki-context-soak-') as tmp:
+        spill_dir = Path(tmp)
+
+        def spill(key, context):
+            with open(spill_dir / f"{key}.json", 'w', encoding='utf-8') as f:
+                json.dump(context, f)
+
+        def load(key):
+            try:
+                with open(spill_dir / f"{key}.json", 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                return None
+
+        def estimate(context):
+            return sum(len(message['content']) + 200 for message in context['history']) + 400
+
+        store = ContextStore(max_contexts=max_contexts, spill=spill, load=load, estimate=estimate)
+        rss_start = process_rss_bytes() or 0
+        rss_peak = rss_start
+        started = time.monotonic()
+        for n in range(sessions):
+            context = {'session_id': f"soak-{n}", 'history': []}
+            for turn in range(turns):
+                context['history'].append({'role': 'user', 'content': f"question {turn} for session {n} " * 4})
+                context['history'].append({'role': 'assistant', 'content': f"answer {turn} " * 20})
+            store.put(f"soak-{n}", context)
+            if n % 10000 == 0:
+                rss_peak = max(rss_peak, process_rss_bytes() or 0)
+        elapsed = time.monotonic() - started
+
+        # Evicted sessions must come back intact on their next turn
+        reloaded = [store.get(f"soak-{n}") for n in range(0, sessions - max_contexts, max(1, sessions // 100))]
+        intact = all(context and len(context['history']) == turns * 2 for context in reloaded)
+
+        stats = store.get_stats()
+        growth_mb = (max(rss_peak, stats['rss_bytes'] or 0) - rss_start) / 2 ** 20
+        bounded = stats['resident'] <= max_contexts
+        print(f"{sessions} sessions in {elapsed:.1f}s: {stats['resident']} resident, "
+              f"{stats['evicted_lru']} evicted, {stats['spilled']} spilled, {stats['reloads']} reloaded")
+        print(f"estimated {stats['estimated_bytes'] / 2 ** 20:.1f} MiB in contexts, "
+              f"RSS grew {growth_mb:.1f} MiB {'✅' if bounded and intact else '❌'}")
+        return bounded and intact
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "soak":
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+        sys.exit(0 if run_soak(count) else 1)
+    print("Run with 'soak [sessions]' to push synthetic sessions through a bounded store.")
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Inference Scheduler - Admission control in front of model calls
+Enforces the limits declared in inference-settings.yaml
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+import yaml
+
+INFERENCE_SETTINGS_FILE = Path('/opt/kalki/ai-config/inference-settings.yaml')
+
+# Lower value is served first
+PRIORITIES = {
+    'terminal': 0,
+    'voice': 1,
+    'gesture': 2,
+    'learning': 3
+}
+
+logger = logging.getLogger('OMNet.scheduler')
+
+_shared_scheduler: Optional['InferenceScheduler'] = None
+
+def load_inference_settings(settings_file: Path = INFERENCE_SETTINGS_FILE) -> Dict:
+    """Return the 'inference' section of inference-settings.yaml, or {} if unavailable"""
+    try:
+        with open(settings_file, 'r') as f:
+            return (yaml.safe_load(f) or {}).get('inference', {})
+    except FileNotFoundError:
+        logger.warning(f"{settings_file} not found, using default inference settings")
+    except (OSError, yaml.YAMLError) as e:
+        logger.error(f"Failed to load inference settings: {str(e)}")
+    return {}
+
+class SchedulerBusy(Exception):
+    """Raised when the wait queue is over budget and a request is shed"""
+
+class _ModelLane:
+    """Concurrency slots and priority-ordered waiters for one model"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiters = []  # heap of (priority, seq, future)
+
+class InferenceScheduler:
+    """
+    Caps concurrent generations per model, queues the excess by priority
+    (interactive terminal > voice > gesture > background learning), enforces
+    a deadline covering both queueing and generation, and sheds load with
+    SchedulerBusy once too many requests are already waiting.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_requests: int = 4,
+        timeout_seconds: float = 30,
+        max_queue_depth: int = 16,
+        model_concurrency: Optional[Dict[str, int]] = None
+    ):
+        self.max_concurrent_requests = max_concurrent_requests
+        self.timeout_seconds = timeout_seconds
+        self.max_queue_depth = max_queue_depth
+        self.model_concurrency = dict(model_concurrency or {})
+        self.lanes: Dict[str, _ModelLane] = {}
+        self._seq = itertools.count()
+        self.stats = {'admitted': 0, 'queued': 0, 'shed': 0, 'timeouts': 0}
+
+    @classmethod
+    def from_settings(cls, settings_file: Path = INFERENCE_SETTINGS_FILE) -> 'InferenceScheduler':
+        """Build a scheduler from the 'inference' section of inference-settings.yaml"""
+        settings = load_inference_settings(settings_file)
+        return cls(
+            max_concurrent_requests=int(settings.get('max_concurrent_requests', 4)),
+            timeout_seconds=float(settings.get('timeout_seconds', 30)),
+            max_queue_depth=int(settings.get('max_queue_depth', 16)),
+            model_concurrency=settings.get('model_concurrency') or {}
+        )
+
+    def model_limit(self, model: str) -> int:
+        """Concurrent generations allowed for a model"""
+        return int(self.model_concurrency.get(model, self.max_concurrent_requests))
+
+    def queue_depth(self, model: Optional[str] = None) -> int:
+        """Requests waiting for a slot, for one model or across all of them"""
+        if model is not None:
+            lane = self.lanes.get(model)
+            return len(lane.waiters) if lane else 0
+        return sum(len(lane.waiters) for lane in self.lanes.values())
+
+    def _lane(self, model: str) -> _ModelLane:
+        lane = self.lanes.get(model)
+        if lane is None:
+            lane = self.lanes[model] = _ModelLane(self.model_limit(model))
+        return lane
+
+    async def _acquire(self, model: str, priority: str, deadline: float):
+        lane = self._lane(model)
+        if lane.active < lane.limit and not lane.waiters:
+            lane.active += 1
+            return
+
+        if self.queue_depth() >= self.max_queue_depth:
+            self.stats['shed'] += 1
+            raise SchedulerBusy(f"{model} queue is full")
+
+        self.stats['queued'] += 1
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (PRIORITIES.get(priority, PRIORITIES['terminal']), next(self._seq), waiter)
+        heapq.heappush(lane.waiters, entry)
+        try:
+            async with asyncio.timeout_at(deadline):
+                await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self._release(model)
+            else:
+                waiter.cancel()
+                if entry in lane.waiters:
+                    lane.waiters.remove(entry)
+                    heapq.heapify(lane.waiters)
+            raise
+
+    def _release(self, model: str):
+        lane = self.lanes[model]
+        lane.active -= 1
+        while lane.waiters:
+            _, _, waiter = heapq.heappop(lane.waiters)
+            # Skip waiters whose task was cancelled but has not run its cleanup yet
+            if not waiter.done():
+                lane.active += 1
+                waiter.set_result(None)
+                return
+
+    async def acquire(self, model: str, priority: str = 'terminal') -> float:
+        """
+        Take a generation slot for model and return the request deadline
+
+        For work that can outlive the caller waiting on it, such as a
+        blocking client call on a thread: pass the work's future to
+        release_when_done(), so the slot stays taken until the work has
+        actually finished even if the caller gives up at the deadline.
+        Raises like slot().
+        """
+        deadline = asyncio.get_running_loop().time() + self.timeout_seconds
+        try:
+            await self._acquire(model, priority, deadline)
+        except TimeoutError:
+            self.stats['timeouts'] += 1
+            raise
+        self.stats['admitted'] += 1
+        return deadline
+
+    def release_when_done(self, model: str, work: asyncio.Future):
+        """Free the slot acquire() took for model once work completes"""
+        work.add_done_callback(lambda _: self._release(model))
+
+    def record_timeout(self):
+        """Count a generation that ran past its deadline outside slot()"""
+        self.stats['timeouts'] += 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, model: str, priority: str = 'terminal') -> AsyncIterator[float]:
+        """
+        Hold a generation slot for model for the duration of the block
+
+        Yields the request deadline (event loop time), timeout_seconds after
+        arrival. Queueing past it raises TimeoutError; the block applies it
+        to the generation itself, e.g. with asyncio.timeout_at(deadline), so
+        streaming callers can bound each chunk instead of yielding inside a
+        timeout scope. Raises SchedulerBusy if the request is shed.
+        """
+        deadline = await self.acquire(model, priority)
+        try:
+            yield deadline
+        except TimeoutError:
+            self.stats['timeouts'] += 1
+            raise
+        finally:
+            self._release(model)
+
+    def get_stats(self) -> Dict:
+        """Admission counters plus per-model slot usage"""
+        return {
+            **self.stats,
+            'waiting': self.queue_depth(),
+            'models': {
+                model: {'active': lane.active, 'waiting': len(lane.waiters), 'limit': lane.limit}
+                for model, lane in self.lanes.items()
+            }
+        }
+
+def get_inference_scheduler() -> InferenceScheduler:
+    """Return the scheduler shared by every model caller in this process"""
+    global _shared_scheduler
+
+    if _shared_scheduler is None:
+        _shared_scheduler = InferenceScheduler.from_settings()
+    return _shared_scheduler
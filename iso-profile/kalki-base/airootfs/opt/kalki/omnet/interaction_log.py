@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Interaction Log Writer - Group-commit logging of OMNet interactions
+Batches records from a bounded queue into rotating JSONL segment files
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger('OMNet.interactions')
+
+_STOP = object()  # queued by close() to end run() after the batch in hand
+
+class InteractionLogWriter:
+    """Background writer fed by a bounded queue
+
+    Request handlers call submit(), which never blocks: when the queue is
+    full the record is dropped and counted. The writer task flushes a batch
+    once batch_size records are waiting or flush_interval seconds have passed
+    since the first one arrived, appending to the current segment file and
+    rolling to a new one past segment_bytes. close() stops the writer
+    through the queue rather than by cancelling it, so a batch being
+    written is never interrupted or lost.
+    """
+
+    def __init__(
+        self,
+        log_dir: Path = Path('/var/log/kalki/interactions'),
+        max_queue: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+        segment_bytes: int = 16 * 1024 * 1024,
+        max_segments: int = 32
+    ):
+        self.log_dir = Path(log_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+
+        self._segment = None
+        self._segment_path: Optional[Path] = None
+        self._segment_seq = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+        self._running = False
+        self._stopped = asyncio.Event()
+
+    def submit(self, record: Dict) -> bool:
+        """Queue a record for writing; returns False if it was dropped"""
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def run(self):
+        """Collect queued records into batches and write them off the event loop, until close()"""
+        loop = asyncio.get_running_loop()
+        self._running = True
+        self._stopped.clear()
+        try:
+            stopping = False
+            while not stopping:
+                record = await self.queue.get()
+                if record is _STOP:
+                    break
+                batch = [record]
+                deadline = loop.time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        record = self.queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            record = await asyncio.wait_for(self.queue.get(), timeout)
+                        except asyncio.TimeoutError:
+                            break
+                    if record is _STOP:
+                        stopping = True
+                        break
+                    batch.append(record)
+                await loop.run_in_executor(None, self._write_batch, batch)
+        finally:
+            self._running = False
+            self._stopped.set()
+
+    async def close(self):
+        """Stop the writer once it has written what it holds, flush the rest and close the segment"""
+        if self._running:
+            # Waits for room rather than dropping: the writer is draining the queue
+            await self.queue.put(_STOP)
+            await self._stopped.wait()
+        batch = []
+        while not self.queue.empty():
+            record = self.queue.get_nowait()
+            if record is not _STOP:
+                batch.append(record)
+        loop = asyncio.get_running_loop()
+        if batch:
+            await loop.run_in_executor(None, self._write_batch, batch)
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _write_batch(self, batch: List[Dict]):
+        started = time.monotonic()
+        try:
+            if self._segment is None:
+                self._open_segment()
+            self._segment.write(''.join(json.dumps(record) + '\n' for record in batch))
+            self._segment.flush()
+            self.written += len(batch)
+            self.batches += 1
+
+            if self._segment.tell() >= self.segment_bytes:
+                self._segment.close()
+                self._segment = None
+                self._prune_segments()
+        except Exception as e:
+            # Losing a batch of learning logs must never take down OMNet
+            self.dropped += len(batch)
+            logger.error(f"Failed to write interaction batch: {str(e)}")
+        self.last_flush_ms = round((time.monotonic() - started) * 1000, 2)
+
+    def _open_segment(self):
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self._segment_seq += 1
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        self._segment_path = self.log_dir / f"interactions-{stamp}-{os.getpid()}-{self._segment_seq:04d}.jsonl"
+        self._segment = open(self._segment_path, 'a', encoding='utf-8')
+
+    def _prune_segments(self):
+        segments = sorted(self.log_dir.glob('interactions-*.jsonl'), key=lambda p: p.stat().st_mtime)
+        for old in segments[:-self.max_segments]:
+            try:
+                old.unlink()
+            except OSError as e:
+                logger.warning(f"Failed to remove old interaction segment {old}: {str(e)}")
+
+    def get_stats(self) -> Dict:
+        """Writer counters for the OMNet stats frame"""
+        return {
+            'queued': self.queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'last_flush_ms': self.last_flush_ms,
+            'segment': str(self._segment_path) if self._segment_path else None
+        }
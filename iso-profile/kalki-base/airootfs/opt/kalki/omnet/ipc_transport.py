@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+OMNet IPC Transport - Length-prefixed frames over a Unix domain socket
+Lets local daemons reach OMNet without TCP loopback or a WebSocket handshake
+"""
+
+import asyncio
+import json
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; JSON frames always work
+    msgpack = None
+
+SOCKET_PATH = Path(os.environ.get('KALKI_OMNET_SOCKET', '/run/kalki/omnet.sock'))
+
+CODEC_JSON = 0
+CODEC_MSGPACK = 1
+
+# Each frame: 1-byte codec id, 4-byte big-endian payload length, payload
+FRAME_HEADER = struct.Struct('!BI')
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+class FrameError(Exception):
+    """Raised for malformed, oversized or undecodable frames"""
+
+def encode_frame(payload: Dict, codec: int = CODEC_JSON) -> bytes:
+    """Serialize a message into a length-prefixed frame"""
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise FrameError("msgpack codec requested but msgpack is not installed")
+        body = msgpack.packb(payload, use_bin_type=True)
+    elif codec == CODEC_JSON:
+        body = json.dumps(payload).encode('utf-8')
+    else:
+        raise FrameError(f"Unknown codec {codec}")
+    return FRAME_HEADER.pack(codec, len(body)) + body
+
+def decode_payload(codec: int, body: bytes) -> Dict:
+    """Deserialize a frame body written with the given codec"""
+    try:
+        if codec == CODEC_MSGPACK:
+            if msgpack is None:
+                raise FrameError("msgpack frame received but msgpack is not installed")
+            return msgpack.unpackb(body, raw=False)
+        if codec == CODEC_JSON:
+            return json.loads(body)
+    except (ValueError, TypeError) as e:
+        raise FrameError(f"Undecodable frame: {str(e)}") from e
+    raise FrameError(f"Unknown codec {codec}")
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Tuple[int, Dict]]:
+    """Read one frame, returning (codec, message), or None at a clean end of stream"""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise FrameError("Connection closed mid-header") from e
+        return None
+
+    codec, length = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_BYTES:
+        raise FrameError(f"Frame of {length} bytes exceeds the {MAX_FRAME_BYTES} byte limit")
+    try:
+        body = await reader.readexactly(length)
+    except asyncio.IncompleteReadError as e:
+        raise FrameError("Connection closed mid-frame") from e
+    return codec, decode_payload(codec, body)
+
+class OMNetIPCClient:
+    """Client for OMNet's Unix socket, speaking the same messages as the WebSocket API"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, codec: int):
+        self.reader = reader
+        self.writer = writer
+        self.codec = codec
+
+    @classmethod
+    async def connect(cls, path: Path = SOCKET_PATH, codec: Optional[int] = None) -> 'OMNetIPCClient':
+        """Connect to OMNet; defaults to msgpack when it is installed"""
+        if codec is None:
+            codec = CODEC_MSGPACK if msgpack is not None else CODEC_JSON
+        reader, writer = await asyncio.open_unix_connection(str(path))
+        return cls(reader, writer, codec)
+
+    async def send(self, message: Dict):
+        self.writer.write(encode_frame(message, self.codec))
+        await self.writer.drain()
+
+    async def recv(self) -> Dict:
+        frame = await read_frame(self.reader)
+        if frame is None:
+            raise ConnectionError("OMNet closed the connection")
+        return frame[1]
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
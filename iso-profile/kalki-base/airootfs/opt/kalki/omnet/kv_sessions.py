@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+KV Sessions - Resume conversations from the model's returned context
+Keeps Ollama's per-turn context tokens so the next turn sends only the new message
+"""
+
+import hashlib
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Sequence
+
+from inference_scheduler import INFERENCE_SETTINGS_FILE, load_inference_settings
+
+class _KVState:
+    __slots__ = ('model', 'prompt_hash', 'history_len', 'tokens')
+
+    def __init__(self, model: str, prompt_hash: str, history_len: int, tokens: array):
+        self.model = model
+        self.prompt_hash = prompt_hash
+        self.history_len = history_len
+        self.tokens = tokens
+
+class KVSessionCache:
+    """
+    Ollama's /api/generate returns a 'context': the token state after the
+    reply. Passing it back with only the next user message lets the model
+    continue without re-prefilling the system prompt and history.
+
+    A state is reusable only for the same model and system prompt, and
+    only if the session's history is exactly as long as when it was stored
+    (nothing was added, replaced or reloaded behind our back) and the
+    state still fits the model's token budget. Anything else is a miss and
+    the caller replays the full conversation. States live in memory only,
+    at most max_sessions of them, least recently used evicted first;
+    tokens are kept as a compact int array.
+    """
+
+    def __init__(self, enabled: bool = True, max_sessions: int = 1024):
+        self.enabled = enabled
+        self.max_sessions = max_sessions
+        self.entries: OrderedDict = OrderedDict()
+        self.stats = {'reused': 0, 'evictions': 0}
+        self.misses: Dict[str, int] = {}
+
+    @classmethod
+    def from_settings(cls, settings_file: Path = INFERENCE_SETTINGS_FILE) -> 'KVSessionCache':
+        """Build from the 'kv_reuse' block of inference-settings.yaml"""
+        settings = load_inference_settings(settings_file).get('kv_reuse') or {}
+        return cls(
+            enabled=bool(settings.get('enabled', True)),
+            max_sessions=int(settings.get('max_sessions', 1024))
+        )
+
+    @staticmethod
+    def _hash(system_prompt: str) -> str:
+        return hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()
+
+    def _miss(self, reason: str) -> None:
+        self.misses[reason] = self.misses.get(reason, 0) + 1
+        return None
+
+    def lookup(
+        self, key: Hashable, model: str, system_prompt: str, history_len: int, token_budget: int,
+        new_tokens: int = 0
+    ) -> Optional[List[int]]:
+        """
+        Context tokens to resume from, or None if the turn must be replayed
+
+        new_tokens is the size of what will be sent on top of the context;
+        the two together must fit token_budget.
+        """
+        state = self.entries.get(key)
+        if state is None:
+            return self._miss('no_state')
+        if state.model != model:
+            return self._miss('model_switch')
+        if state.prompt_hash != self._hash(system_prompt):
+            return self._miss('prompt_changed')
+        if state.history_len != history_len:
+            return self._miss('history_diverged')
+        if len(state.tokens) + new_tokens >= token_budget:
+            return self._miss('over_budget')
+        self.entries.move_to_end(key)
+        self.stats['reused'] += 1
+        return state.tokens.tolist()
+
+    def store(self, key: Hashable, model: str, system_prompt: str, history_len: int, tokens: Sequence[int]):
+        """Remember the context returned after a turn that left history_len messages"""
+        if not tokens:
+            self.entries.pop(key, None)
+            return
+        self.entries[key] = _KVState(model, self._hash(system_prompt), history_len, array('i', tokens))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_sessions:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def drop(self, key: Hashable):
+        self.entries.pop(key, None)
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats['reused'] + sum(self.misses.values())
+        return {
+            **self.stats,
+            'misses': dict(self.misses),
+            'reuse_rate': round(self.stats['reused'] / lookups, 3) if lookups else 0.0,
+            'sessions': len(self.entries),
+            'tokens_held': sum(len(state.tokens) for state in self.entries.values())
+        }
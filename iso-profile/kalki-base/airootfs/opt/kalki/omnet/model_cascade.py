@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Model Cascade - Answer with a small model first, escalate when needed
+Decides when a request needs the avatar's large model and records the outcome
+"""
+
+import re
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from inference_scheduler import INFERENCE_SETTINGS_FILE, load_inference_settings
+
+DEFAULT_ESCALATE_KEYWORDS = [
+    'debug', 'error', 'fix', 'code', 'write', 'create', 'story', 'poem', 'explain', 'analyze'
+]
+DEFAULT_HEDGE_PHRASES = [
+    "i'm not sure", "i am not sure", "i don't know", "i do not know",
+    "i cannot", "i can't help", "as an ai", "i'm unable", "i am unable"
+]
+
+_shared_cascade: Optional['ModelCascade'] = None
+
+class _TierLatency:
+    """Latency samples for one tier; keeps the most recent ones for percentiles"""
+
+    def __init__(self, window: int = 256):
+        self.count = 0
+        self.total_ms = 0.0
+        self.samples = deque(maxlen=window)
+
+    def record(self, ms: float):
+        self.count += 1
+        self.total_ms += ms
+        self.samples.append(ms)
+
+    def summary(self) -> Dict:
+        ordered = sorted(self.samples)
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 1) if self.count else 0.0,
+            'p50_ms': round(ordered[len(ordered) // 2], 1) if ordered else 0.0,
+            'p95_ms': round(ordered[int(len(ordered) * 0.95)], 1) if ordered else 0.0
+        }
+
+class ModelCascade:
+    """
+    Two-tier routing: a small, usually resident model answers first and the
+    avatar's own model is used only when the request needs it.
+
+    A request goes straight to the large model when it is longer than
+    max_input_words or mentions one of escalate_keywords. Otherwise the small
+    model answers, and its reply is escalated if a cheap confidence check
+    fails: too short, hedging, cut off at the token limit, or repetitive.
+    Escalation reasons and per-tier latency are kept for tuning.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        small_model: str = 'phi3:mini',
+        max_input_words: int = 40,
+        escalate_keywords: Optional[List[str]] = None,
+        min_response_words: int = 3,
+        hedge_phrases: Optional[List[str]] = None
+    ):
+        self.enabled = enabled
+        self.small_model = small_model
+        self.max_input_words = max_input_words
+        self.escalate_keywords = [k.lower() for k in (escalate_keywords or DEFAULT_ESCALATE_KEYWORDS)]
+        self.min_response_words = min_response_words
+        self.hedge_phrases = [p.lower() for p in (hedge_phrases or DEFAULT_HEDGE_PHRASES)]
+        self.latency = {'small': _TierLatency(), 'large': _TierLatency()}
+        self.stats = {'requests': 0, 'answered_small': 0, 'escalated': 0}
+        self.escalation_reasons: Dict[str, int] = {}
+
+    @classmethod
+    def from_settings(cls, settings_file: Path = INFERENCE_SETTINGS_FILE) -> 'ModelCascade':
+        """Build a cascade from the 'cascade' block of inference-settings.yaml"""
+        settings = load_inference_settings(settings_file).get('cascade') or {}
+        return cls(
+            enabled=bool(settings.get('enabled', True)),
+            small_model=settings.get('small_model', 'phi3:mini'),
+            max_input_words=int(settings.get('max_input_words', 40)),
+            escalate_keywords=settings.get('escalate_keywords'),
+            min_response_words=int(settings.get('min_response_words', 3)),
+            hedge_phrases=settings.get('hedge_phrases')
+        )
+
+    def applies_to(self, model: str) -> bool:
+        """Whether a request routed to model should try the small tier first"""
+        return self.enabled and model != self.small_model
+
+    def route(self, user_input: str) -> Optional[str]:
+        """Reason to skip the small tier for this input, or None to try it first"""
+        self.stats['requests'] += 1
+        words = re.findall(r'\w+', user_input.lower())
+        if len(words) > self.max_input_words:
+            return self.escalate('length')
+        if any(keyword in words for keyword in self.escalate_keywords):
+            return self.escalate('intent')
+        return None
+
+    def check(self, response: str, done_reason: Optional[str] = None) -> Optional[str]:
+        """Confidence check on a small-model reply; returns the escalation reason, if any"""
+        text = response.strip().lower()
+        words = text.split()
+        if len(words) < self.min_response_words:
+            return self.escalate('confidence:short')
+        if done_reason == 'length':
+            return self.escalate('confidence:truncated')
+        if any(phrase in text for phrase in self.hedge_phrases):
+            return self.escalate('confidence:hedged')
+        if len(words) >= 20 and len(set(words)) / len(words) < 0.3:
+            return self.escalate('confidence:repetitive')
+        self.stats['answered_small'] += 1
+        return None
+
+    def escalate(self, reason: str) -> str:
+        self.stats['escalated'] += 1
+        self.escalation_reasons[reason] = self.escalation_reasons.get(reason, 0) + 1
+        return reason
+
+    def record_latency(self, tier: str, ms: float):
+        self.latency[tier].record(ms)
+
+    def get_stats(self) -> Dict:
+        """Escalation rate, reasons and per-tier latency"""
+        requests = self.stats['requests']
+        return {
+            **self.stats,
+            'escalation_rate': round(self.stats['escalated'] / requests, 3) if requests else 0.0,
+            'escalation_reasons': dict(self.escalation_reasons),
+            'latency': {tier: latency.summary() for tier, latency in self.latency.items()}
+        }
+
+def get_model_cascade() -> ModelCascade:
+    """Return the cascade policy shared by every model caller in this process"""
+    global _shared_cascade
+
+    if _shared_cascade is None:
+        _shared_cascade = ModelCascade.from_settings()
+    return _shared_cascade
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Model Executor - Dedicated thread pool for blocking model client calls
+Keeps Ollama I/O off the event loop's default executor and measures its queueing
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from inference_scheduler import INFERENCE_SETTINGS_FILE, load_inference_settings
+
+_shared_executor: Optional['ModelExecutor'] = None
+
+class ModelExecutor:
+    """
+    A named, bounded ThreadPoolExecutor for the blocking Ollama client.
+
+    Callers take an InferenceScheduler slot before submitting and free it
+    only when the submitted call has finished, not when they stop waiting
+    for it, so a call that ran past its deadline keeps its slot until its
+    thread is done. The pool is therefore sized to the sum of the per-model
+    concurrency limits: enough for every slot to be busy at once, and no
+    more. Calls that still have to wait for a thread are counted with
+    their wait time.
+    """
+
+    def __init__(self, max_workers: int = 4, name: str = 'kalki-model'):
+        self.max_workers = max_workers
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.stats = {'calls': 0, 'waited': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0, 'run_ms_total': 0.0}
+
+    @classmethod
+    def from_settings(cls, settings_file: Path = INFERENCE_SETTINGS_FILE) -> 'ModelExecutor':
+        """
+        Size from the 'model_executor' block of inference-settings.yaml, or
+        from the scheduler limits when max_workers is not set
+        """
+        settings = load_inference_settings(settings_file)
+        max_workers = (settings.get('model_executor') or {}).get('max_workers')
+        if not max_workers:
+            per_model = settings.get('model_concurrency') or {}
+            max_workers = max(int(settings.get('max_concurrent_requests', 4)), sum(int(n) for n in per_model.values()))
+        return cls(max_workers=int(max_workers))
+
+    async def run(self, fn: Callable[[], Any]) -> Any:
+        """Run fn on the pool and await its result"""
+        return await self.submit(fn)
+
+    def submit(self, fn: Callable[[], Any]) -> asyncio.Future:
+        """Schedule fn on the pool; the returned future may be awaited or left to run"""
+        loop = asyncio.get_running_loop()
+        submitted = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+
+        def call():
+            started = time.monotonic()
+            wait_ms = (started - submitted) * 1000
+            with self._lock:
+                self.waiting -= 1
+                self.running += 1
+                self.stats['calls'] += 1
+                self.stats['wait_ms_total'] += wait_ms
+                self.stats['wait_ms_max'] = max(self.stats['wait_ms_max'], wait_ms)
+                if wait_ms >= 1:
+                    self.stats['waited'] += 1
+            try:
+                return fn()
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.stats['run_ms_total'] += (time.monotonic() - started) * 1000
+
+        return loop.run_in_executor(self.pool, call)
+
+    def get_stats(self) -> Dict:
+        """Pool size, queue depth and wait/run times"""
+        with self._lock:
+            calls = self.stats['calls']
+            return {
+                'max_workers': self.max_workers,
+                'queue_depth': self.waiting,
+                'running': self.running,
+                'calls': calls,
+                'waited': self.stats['waited'],
+                'avg_wait_ms': round(self.stats['wait_ms_total'] / calls, 2) if calls else 0.0,
+                'max_wait_ms': round(self.stats['wait_ms_max'], 2),
+                'avg_run_ms': round(self.stats['run_ms_total'] / calls, 1) if calls else 0.0
+            }
+
+def get_model_executor() -> ModelExecutor:
+    """Return the model executor shared by every blocking model caller in this process"""
+    global _shared_executor
+
+    if _shared_executor is None:
+        _shared_executor = ModelExecutor.from_settings()
+    return _shared_executor
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Model Pool - Keep avatar models resident in Ollama
+Warms configured models at startup and sizes keep_alive to recent traffic
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from inference_scheduler import INFERENCE_SETTINGS_FILE, load_inference_settings
+
+logger = logging.getLogger('OMNet.models')
+
+_shared_pool: Optional['ModelPool'] = None
+
+class ModelPool:
+    """
+    Tracks which models Ollama has loaded and how busy each one is.
+
+    The warm_models are loaded once at startup so the first request to an
+    avatar does not pay a cold model load. Every model call asks for a
+    keep_alive: busy_keep_alive for warm models and for models that saw
+    busy_threshold requests within activity_window seconds, idle_keep_alive
+    otherwise, so rarely used models give their memory back sooner. The
+    resident set is refreshed from Ollama's /api/ps every refresh_interval
+    seconds and callers can prefer a model that is already loaded. When a
+    caller settles for a later candidate because the first is not loaded,
+    the first is warmed in the background, so traffic returns to it instead
+    of keeping the stand-in resident indefinitely.
+    """
+
+    def __init__(
+        self,
+        warm_models: Optional[List[str]] = None,
+        busy_keep_alive: str = '30m',
+        idle_keep_alive: str = '5m',
+        busy_threshold: int = 3,
+        activity_window: float = 600,
+        refresh_interval: float = 30
+    ):
+        self.warm_models = list(warm_models or [])
+        self.busy_keep_alive = busy_keep_alive
+        self.idle_keep_alive = idle_keep_alive
+        self.busy_threshold = busy_threshold
+        self.activity_window = activity_window
+        self.refresh_interval = refresh_interval
+        self.recent: Dict[str, deque] = {}
+        self.resident: Dict[str, Optional[str]] = {}  # model -> expiry reported by Ollama
+        self.client = None  # set by maintain(); needed for background warm-ups
+        self._warming: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            'warmed': 0, 'warm_failures': 0, 'background_warms': 0,
+            'resident_hits': 0, 'cold_starts': 0, 'refresh_failures': 0
+        }
+
+    @classmethod
+    def from_settings(cls, settings_file: Path = INFERENCE_SETTINGS_FILE) -> 'ModelPool':
+        """Build a pool from the 'model_pool' block of inference-settings.yaml"""
+        settings = load_inference_settings(settings_file).get('model_pool') or {}
+        return cls(
+            warm_models=settings.get('warm_models') or [],
+            busy_keep_alive=str(settings.get('busy_keep_alive', '30m')),
+            idle_keep_alive=str(settings.get('idle_keep_alive', '5m')),
+            busy_threshold=int(settings.get('busy_threshold', 3)),
+            activity_window=float(settings.get('activity_window_seconds', 600)),
+            refresh_interval=float(settings.get('refresh_interval_seconds', 30))
+        )
+
+    def _prune(self, model: str, now: float) -> deque:
+        times = self.recent.setdefault(model, deque())
+        while times and times[0] <= now - self.activity_window:
+            times.popleft()
+        return times
+
+    def record_request(self, model: str):
+        """Note a model call, counting whether the model was already loaded"""
+        now = time.monotonic()
+        self._prune(model, now).append(now)
+        self.stats['resident_hits' if model in self.resident else 'cold_starts'] += 1
+        # Ollama loads it for this call, so treat it as resident until the next refresh
+        self.resident.setdefault(model, None)
+
+    def recent_requests(self, model: str) -> int:
+        return len(self._prune(model, time.monotonic()))
+
+    def keep_alive_for(self, model: str) -> str:
+        """keep_alive to send with a call to model"""
+        if model in self.warm_models or self.recent_requests(model) >= self.busy_threshold:
+            return self.busy_keep_alive
+        return self.idle_keep_alive
+
+    def is_resident(self, model: str) -> bool:
+        return model in self.resident
+
+    def prefer_resident(self, candidates: List[str]) -> str:
+        """First candidate that is already loaded, else the first candidate
+
+        Choosing a later candidate starts loading the first one in the
+        background, so the next request can go back to it.
+        """
+        candidates = [model for model in candidates if model]
+        for model in candidates:
+            if model in self.resident:
+                if model != candidates[0]:
+                    self._warm_in_background(candidates[0])
+                return model
+        return candidates[0]
+
+    def _warm_in_background(self, model: str):
+        if self.client is None or model in self._warming:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.stats['background_warms'] += 1
+        task = loop.create_task(self.warm(self.client, model))
+        self._warming[model] = task
+        task.add_done_callback(lambda _: self._warming.pop(model, None))
+
+    async def warm(self, client, model: str) -> bool:
+        """Load one model without generating; returns True once it is resident"""
+        started = time.monotonic()
+        try:
+            # An empty prompt makes Ollama load the model without generating
+            await client.generate(model=model, prompt='', keep_alive=self.keep_alive_for(model))
+        except Exception as e:
+            self.stats['warm_failures'] += 1
+            logger.warning(f"Failed to warm {model}: {str(e)}")
+            return False
+        self.resident.setdefault(model, None)
+        self.stats['warmed'] += 1
+        logger.info(f"Warmed {model} in {time.monotonic() - started:.1f}s")
+        return True
+
+    async def warm_up(self, client):
+        """Load the warm models one at a time; loading them together would thrash memory"""
+        for model in self.warm_models:
+            await self.warm(client, model)
+
+    async def refresh(self, client):
+        """Replace the resident set with what Ollama reports as loaded"""
+        try:
+            response = await client.ps()
+        except Exception as e:
+            self.stats['refresh_failures'] += 1
+            logger.warning(f"Failed to list loaded models: {str(e)}")
+            return
+        self.resident = {
+            loaded.model: str(loaded.expires_at) if loaded.expires_at else None
+            for loaded in response.models
+        }
+
+    async def maintain(self, client):
+        """Warm up, then keep the resident set current"""
+        self.client = client
+        await self.warm_up(client)
+        while True:
+            await self.refresh(client)
+            await asyncio.sleep(self.refresh_interval)
+
+    def get_stats(self) -> Dict:
+        """Hot models, their expiry and recent traffic"""
+        models = set(self.resident) | set(self.recent)
+        return {
+            **self.stats,
+            'hot': self.resident,
+            'warming': sorted(self._warming),
+            'recent_requests': {model: self.recent_requests(model) for model in sorted(models)},
+            'keep_alive': {model: self.keep_alive_for(model) for model in sorted(models)}
+        }
+
+def get_model_pool() -> ModelPool:
+    """Return the model pool shared by every model caller in this process"""
+    global _shared_pool
+
+    if _shared_pool is None:
+        _shared_pool = ModelPool.from_settings()
+    return _shared_pool
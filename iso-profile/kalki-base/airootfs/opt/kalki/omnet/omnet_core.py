@@ -7,55 +7,138 @@ Coordinates all avatars, processes requests, and maintains system harmony
 import asyncio
 import json
 import logging
+import os
+import signal
+import sys
+import time
 import websockets
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
 import ollama
 
+from inference_scheduler import SchedulerBusy, get_inference_scheduler
+from interaction_log import InteractionLogWriter
+from ipc_transport import CODEC_JSON, SOCKET_PATH, FrameError, encode_frame, read_frame
+from model_pool import get_model_pool
+from response_cache import get_response_cache
+
+AVATAR_CONFIG_FILE = Path('/opt/kalki/avatars/avatar-config.json')
+CONFIG_WATCH_INTERVAL = 2.0  # seconds between avatar-config.json checks
+
+BUSY_MESSAGE = 'The avatars are all in deep meditation right now. Please try again in a moment.'
+TIMEOUT_MESSAGE = 'This answer is taking longer than the dharma allows. Please try again.'
+
+_logging_configured = False
+_shared_core: Optional['OMNetCore'] = None
+
 class OMNetCore:
-    def __init__(self):
+    def __init__(self, config_file: Path = AVATAR_CONFIG_FILE):
+        self.config_file = Path(config_file)
         self.avatars = {}
         self.active_sessions = {}
-        self.load_avatar_configs()
+        self._config_signature = None
+        # Shared async client: one keep-alive connection pool to the Ollama
+        # daemon, so generations never block the event loop
+        self.ollama = ollama.AsyncClient()
+        self.interaction_log = InteractionLogWriter()
+        self.scheduler = get_inference_scheduler()
+        self.response_cache = get_response_cache()
+        self.model_pool = get_model_pool()
+        # Generations in progress, keyed like the response cache, so
+        # identical concurrent requests share one model call
+        self._in_flight: Dict[tuple, asyncio.Task] = {}
+        self._in_flight_waiters: Dict[asyncio.Task, int] = {}
+        self.counters = {'requests': 0, 'coalesced': 0, 'cancelled': 0}
         self.setup_logging()
+        self.load_avatar_configs()
         
-    def load_avatar_configs(self):
-        """Load avatar personality configurations"""
-        config_file = Path('/opt/kalki/avatars/avatar-config.json')
-        if config_file.exists():
-            with open(config_file, 'r') as f:
+    def _read_config_signature(self) -> Optional[tuple]:
+        """Return (mtime, size) of the avatar config, or None if it is missing"""
+        try:
+            stat = self.config_file.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def load_avatar_configs(self) -> bool:
+        """Load avatar personality configurations
+        
+        The parsed config is swapped in with a single assignment, so requests
+        already running keep the snapshot they started with. Returns True if
+        a new config was installed.
+        """
+        signature = self._read_config_signature()
+        if signature is None or signature == self._config_signature:
+            return False
+        
+        try:
+            with open(self.config_file, 'r') as f:
                 config = json.load(f)
-                self.avatars = config.get('avatars', {})
+        except (OSError, json.JSONDecodeError) as e:
+            # Keep serving the last good config until the file is fixed
+            self.logger.error(f"Failed to load avatar config: {str(e)}")
+            return False
+        
+        self.avatars = config.get('avatars', {})
+        self._config_signature = signature
+        return True
+    
+    async def watch_avatar_configs(self, interval: float = CONFIG_WATCH_INTERVAL):
+        """Watch avatar-config.json and hot-reload it when it changes"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if self._read_config_signature() == self._config_signature:
+                continue
+            if await loop.run_in_executor(None, self.load_avatar_configs):
+                self.logger.info(f"Reloaded avatar config from {self.config_file}")
         
     def setup_logging(self):
-        """Configure dharmic logging system"""
-        log_dir = Path('/var/log/kalki')
-        log_dir.mkdir(exist_ok=True, parents=True)
+        """Configure dharmic logging system (once per process)"""
+        global _logging_configured
         
-        logging.basicConfig(
-            filename=log_dir / 'omnet.log',
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        if not _logging_configured:
+            log_dir = Path('/var/log/kalki')
+            log_dir.mkdir(exist_ok=True, parents=True)
+            
+            logging.basicConfig(
+                filename=log_dir / 'omnet.log',
+                level=logging.INFO,
+                format='%(asctime)s - %(levelname)s - %(message)s'
+            )
+            _logging_configured = True
         self.logger = logging.getLogger('OMNet')
         
+    def prepare_request(self, avatar_name: str) -> tuple:
+        """Resolve the model, system prompt and cache eligibility for a request"""
+        # Get avatar personality from the current config snapshot
+        avatars = self.avatars
+        avatar_config = avatars.get(avatar_name, avatars.get('krix'))
+        
+        # Create context-aware prompt; it must not vary per session, since
+        # the response cache and request coalescing key on it
+        system_prompt = self.build_system_prompt(avatar_config)
+        model = self.get_avatar_model(avatar_name)
+        # OMNet requests carry no history, so they are cacheable unless the
+        # avatar opts out with "response_cache": false
+        use_cache = avatar_config.get('response_cache', True)
+        return model, system_prompt, use_cache
+    
     async def process_request(self, request: Dict) -> Dict:
         """Process incoming requests from avatars or terminals"""
         try:
             avatar_name = request.get('avatar', 'krix')
             user_input = request.get('input', '')
             session_id = request.get('session_id', 'default')
+            priority = request.get('priority', 'terminal')
             
-            # Get avatar personality
-            avatar_config = self.avatars.get(avatar_name, self.avatars.get('krix'))
-            
-            # Create context-aware prompt
-            system_prompt = self.build_system_prompt(avatar_config, session_id)
+            model, system_prompt, use_cache = self.prepare_request(avatar_name)
             
-            # Generate response using appropriate model
-            model = self.get_avatar_model(avatar_name)
-            response = await self.generate_response(model, system_prompt, user_input)
+            self.counters['requests'] += 1
+            response = self.response_cache.get(model, system_prompt, user_input) if use_cache else None
+            if response is None:
+                response = await self.generate_coalesced(model, system_prompt, user_input, priority, use_cache)
             
             # Log interaction for learning
             self.log_interaction(avatar_name, user_input, response, session_id)
@@ -67,6 +150,12 @@ class OMNetCore:
                 'session_id': session_id
             }
             
+        except SchedulerBusy as e:
+            self.logger.warning(f"OMNet shed request: {str(e)}")
+            return self.overload_reply(avatar_name, session_id, 'busy')
+        except TimeoutError:
+            self.logger.warning(f"OMNet request for {avatar_name} exceeded its deadline")
+            return self.overload_reply(avatar_name, session_id, 'timeout')
         except Exception as e:
             self.logger.error(f"OMNet processing error: {str(e)}")
             return {
@@ -75,7 +164,157 @@ class OMNetCore:
                 'error': str(e)
             }
     
-    def build_system_prompt(self, avatar_config: Dict, session_id: str) -> str:
+    async def generate_coalesced(
+        self, model: str, system_prompt: str, user_input: str, priority: str, use_cache: bool
+    ) -> str:
+        """Generate a response, attaching to an identical generation already in flight"""
+        key = (model, system_prompt, user_input)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(
+                self.generate_scheduled(model, system_prompt, user_input, priority, use_cache)
+            )
+            self._in_flight[key] = task
+            
+            def forget(done: asyncio.Task):
+                if self._in_flight.get(key) is done:
+                    del self._in_flight[key]
+            task.add_done_callback(forget)
+        else:
+            self.counters['coalesced'] += 1
+        return await self.await_shared(task)
+    
+    async def await_shared(self, task: asyncio.Task) -> str:
+        """Wait on a shared generation, cancelling it once every waiter has gone away"""
+        self._in_flight_waiters[task] = self._in_flight_waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._in_flight_waiters[task] -= 1
+            if not self._in_flight_waiters[task]:
+                del self._in_flight_waiters[task]
+                if not task.done():
+                    # Nobody is left to read the answer; abort the upstream call
+                    task.cancel()
+    
+    async def generate_scheduled(
+        self, model: str, system_prompt: str, user_input: str, priority: str, use_cache: bool
+    ) -> str:
+        """Generate a response once the scheduler admits it, within its deadline"""
+        async with self.scheduler.slot(model, priority) as deadline:
+            async with asyncio.timeout_at(deadline):
+                return await self.generate_response(model, system_prompt, user_input, use_cache)
+    
+    async def stream_request(self, request: Dict) -> AsyncIterator[Dict]:
+        """Process a request, yielding 'delta' frames as tokens arrive and a final 'done' frame"""
+        avatar_name = request.get('avatar', 'krix')
+        user_input = request.get('input', '')
+        session_id = request.get('session_id', 'default')
+        priority = request.get('priority', 'terminal')
+        
+        started = time.monotonic()
+        first_token_at = None
+        parts = []
+        final_chunk = {}
+        try:
+            model, system_prompt, use_cache = self.prepare_request(avatar_name)
+            self.counters['requests'] += 1
+            cached = self.response_cache.get(model, system_prompt, user_input) if use_cache else None
+            in_flight = self._in_flight.get((model, system_prompt, user_input))
+            coalesced = cached is None and in_flight is not None
+            if coalesced:
+                # An identical one-shot generation is running; share its result
+                self.counters['coalesced'] += 1
+                cached = await self.await_shared(in_flight)
+            if cached is not None:
+                self.log_interaction(avatar_name, user_input, cached, session_id)
+                yield {'type': 'delta', 'avatar': avatar_name, 'delta': cached, 'session_id': session_id}
+                yield {
+                    'type': 'done',
+                    'avatar': avatar_name,
+                    'response': cached,
+                    'timestamp': datetime.now().isoformat(),
+                    'session_id': session_id,
+                    'stats': {
+                        **self.build_timing_stats(started, time.monotonic(), {}),
+                        'coalesced' if coalesced else 'cached': True
+                    }
+                }
+                return
+            
+            async with self.scheduler.slot(model, priority) as deadline:
+                async for chunk in self.stream_response(model, system_prompt, user_input, deadline):
+                    delta = chunk['message']['content']
+                    if delta:
+                        if first_token_at is None:
+                            first_token_at = time.monotonic()
+                        parts.append(delta)
+                        yield {
+                            'type': 'delta',
+                            'avatar': avatar_name,
+                            'delta': delta,
+                            'session_id': session_id
+                        }
+                    if chunk.get('done'):
+                        final_chunk = chunk
+        except SchedulerBusy as e:
+            self.logger.warning(f"OMNet shed request: {str(e)}")
+            yield {'type': 'error', **self.overload_reply(avatar_name, session_id, 'busy')}
+            return
+        except TimeoutError:
+            self.logger.warning(f"OMNet stream for {avatar_name} exceeded its deadline")
+            yield {'type': 'error', **self.overload_reply(avatar_name, session_id, 'timeout')}
+            return
+        except Exception as e:
+            self.logger.error(f"OMNet streaming error: {str(e)}")
+            yield {
+                'type': 'error',
+                'avatar': 'krix',
+                'response': 'I sense a disturbance in the digital dharma. Please try again.',
+                'error': str(e),
+                'session_id': session_id
+            }
+            return
+        
+        response = ''.join(parts)
+        if use_cache and response:
+            self.response_cache.put(model, system_prompt, user_input, response)
+        self.log_interaction(avatar_name, user_input, response, session_id)
+        
+        yield {
+            'type': 'done',
+            'avatar': avatar_name,
+            'response': response,
+            'timestamp': datetime.now().isoformat(),
+            'session_id': session_id,
+            'stats': self.build_timing_stats(started, first_token_at, final_chunk)
+        }
+    
+    def overload_reply(self, avatar_name: str, session_id: str, reason: str) -> Dict:
+        """Fast reply for requests that were shed or ran past their deadline"""
+        return {
+            'avatar': avatar_name,
+            'response': BUSY_MESSAGE if reason == 'busy' else TIMEOUT_MESSAGE,
+            'error': reason,
+            'timestamp': datetime.now().isoformat(),
+            'session_id': session_id
+        }
+    
+    def build_timing_stats(self, started: float, first_token_at: Optional[float], final_chunk) -> Dict:
+        """Summarize streaming latency plus the token counters Ollama reports on its last chunk"""
+        finished = time.monotonic()
+        stats = {
+            'first_token_ms': round((first_token_at - started) * 1000, 1) if first_token_at else None,
+            'total_ms': round((finished - started) * 1000, 1),
+            'prompt_tokens': final_chunk.get('prompt_eval_count'),
+            'completion_tokens': final_chunk.get('eval_count')
+        }
+        eval_duration = final_chunk.get('eval_duration')
+        if stats['completion_tokens'] and eval_duration:
+            stats['tokens_per_second'] = round(stats['completion_tokens'] / (eval_duration / 1e9), 2)
+        return stats
+    
+    def build_system_prompt(self, avatar_config: Dict) -> str:
         """Build context-aware system prompt for avatar"""
         base_prompt = f"""
 You are {avatar_config['name']}, an AI avatar in Kalki OS.
@@ -88,13 +327,11 @@ Key principles:
 - Keep responses concise but meaningful
 - Reference your specialty when relevant
 - Always maintain respect for the user's spiritual journey
-
-Current session: {session_id}
 """
         return base_prompt
     
     def get_avatar_model(self, avatar_name: str) -> str:
-        """Get appropriate AI model for avatar"""
+        """Get appropriate AI model for avatar, preferring its fallback if only that is loaded"""
         model_mapping = {
             'krix': 'phi3:mini',
             'mushak': 'codellama:7b',
@@ -103,23 +340,55 @@ Current session: {session_id}
             'bunni': 'mistral:7b',
             'default': 'phi3:mini'
         }
-        return model_mapping.get(avatar_name.lower(), model_mapping['default'])
+        primary = model_mapping.get(avatar_name.lower(), model_mapping['default'])
+        fallback = self.avatars.get(avatar_name, {}).get('model_fallback')
+        return self.model_pool.prefer_resident([primary, fallback])
     
-    async def generate_response(self, model: str, system_prompt: str, user_input: str) -> str:
-        """Generate AI response using Ollama"""
+    async def generate_response(self, model: str, system_prompt: str, user_input: str, use_cache: bool = False) -> str:
+        """Generate AI response using Ollama, optionally storing it in the response cache"""
         try:
-            response = ollama.chat(
+            self.model_pool.record_request(model)
+            response = await self.ollama.chat(
                 model=model,
                 messages=[
                     {'role': 'system', 'content': system_prompt},
                     {'role': 'user', 'content': user_input}
-                ]
+                ],
+                keep_alive=self.model_pool.keep_alive_for(model)
             )
-            return response['message']['content']
+            content = response['message']['content']
+            if use_cache and content:
+                self.response_cache.put(model, system_prompt, user_input, content)
+            return content
         except Exception as e:
             self.logger.error(f"AI generation error: {str(e)}")
             return "The digital dharma flows differently today. Please try again."
     
+    async def stream_response(
+        self, model: str, system_prompt: str, user_input: str, deadline: Optional[float] = None
+    ) -> AsyncIterator:
+        """Stream AI response chunks from Ollama as they are generated, up to an optional deadline"""
+        self.model_pool.record_request(model)
+        async with asyncio.timeout_at(deadline):
+            stream = await self.ollama.chat(
+                model=model,
+                messages=[
+                    {'role': 'system', 'content': system_prompt},
+                    {'role': 'user', 'content': user_input}
+                ],
+                stream=True,
+                keep_alive=self.model_pool.keep_alive_for(model)
+            )
+        while True:
+            # Bound each read rather than the whole loop, so the timeout
+            # scope never spans a yield back to the caller
+            async with asyncio.timeout_at(deadline):
+                try:
+                    chunk = await anext(stream)
+                except StopAsyncIteration:
+                    return
+            yield chunk
+    
     def log_interaction(self, avatar: str, input_text: str, response: str, session_id: str):
         """Log interactions for learning and improvement"""
         interaction = {
@@ -130,34 +399,292 @@ Current session: {session_id}
             'session_id': session_id
         }
         
-        # Log to file for analysis
-        log_file = Path(f'/var/log/kalki/interactions_{session_id}.jsonl')
-        log_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(log_file, 'a') as f:
-            f.write(json.dumps(interaction) + '\n')
+        # Queued for the background group-commit writer; dropped (and counted)
+        # rather than blocking the request when the writer falls behind
+        self.interaction_log.submit(interaction)
+    
+    def get_stats(self) -> Dict:
+        """Server statistics reported by the 'stats' request type"""
+        return {
+            **self.counters,
+            'in_flight': len(self._in_flight),
+            'interaction_log': self.interaction_log.get_stats(),
+            'scheduler': self.scheduler.get_stats(),
+            'response_cache': self.response_cache.get_stats(),
+            'models': self.model_pool.get_stats()
+        }
 
-# WebSocket server for real-time communication
-async def websocket_handler(websocket, path):
-    """Handle WebSocket connections from terminals and applications"""
-    omnet = OMNetCore()
+def get_omnet_core() -> OMNetCore:
+    """Return the OMNet core shared by every connection in this process"""
+    global _shared_core
+    
+    if _shared_core is None:
+        _shared_core = OMNetCore()
+    return _shared_core
+
+class OMNetConnection:
+    """Dispatches the requests arriving on one client connection
+    
+    Requests carrying a client-supplied 'request_id' run concurrently and
+    every frame sent for them is tagged with that id, so replies may arrive
+    out of order. Untagged requests keep the original one-at-a-time,
+    in-order behaviour without holding up tagged ones.
+    
+    A {"type": "cancel", "request_id": ...} frame cancels that request, and
+    closing the connection cancels everything still running on it.
+    """
+    
+    def __init__(self, omnet: OMNetCore, send: Callable[[Dict], Awaitable[None]]):
+        self.omnet = omnet
+        self.send = send
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self._untagged: asyncio.Queue = asyncio.Queue()
+        self._untagged_worker: Optional[asyncio.Task] = None
+    
+    async def dispatch(self, request: Dict):
+        """Start handling a request without waiting for it to finish"""
+        request_id = request.get('request_id')
+        if request.get('type') == 'cancel':
+            await self.cancel(request_id)
+            return
+        if request_id is None:
+            if self._untagged_worker is None:
+                self._untagged_worker = asyncio.create_task(self._serve_untagged())
+            self._untagged.put_nowait(request)
+            return
+        
+        request_id = str(request_id)
+        if request_id in self.tasks:
+            await self._send({
+                'type': 'error',
+                'request_id': request_id,
+                'error': 'request_id already in flight on this connection'
+            })
+            return
+        
+        task = asyncio.create_task(self._serve(request))
+        self.tasks[request_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(request_id, None))
+    
+    async def cancel(self, request_id):
+        """Cancel one in-flight request at the client's request"""
+        task = self.tasks.get(str(request_id))
+        if task is None:
+            await self._send({
+                'type': 'error',
+                'request_id': request_id,
+                'error': 'no request with this request_id is in flight'
+            })
+            return
+        task.cancel()
+        await self._send({'type': 'cancelled', 'request_id': request_id})
+    
+    async def _serve_untagged(self):
+        while True:
+            request = await self._untagged.get()
+            await self._serve(request)
+    
+    async def _serve(self, request: Dict):
+        request_id = request.get('request_id')
+        try:
+            if request.get('type') == 'stats':
+                await self._send({'type': 'stats', 'stats': self.omnet.get_stats()}, request_id)
+            elif request.get('stream'):
+                # Opt-in streaming: incremental delta frames, then a done frame
+                async for frame in self.omnet.stream_request(request):
+                    await self._send(frame, request_id)
+            else:
+                response = await self.omnet.process_request(request)
+                await self._send(response, request_id)
+        except asyncio.CancelledError:
+            self.omnet.counters['cancelled'] += 1
+            raise
+        except Exception as e:
+            self.omnet.logger.error(f"OMNet dispatch error: {str(e)}")
+    
+    async def _send(self, frame: Dict, request_id=None):
+        if request_id is not None:
+            frame['request_id'] = request_id
+        try:
+            await self.send(frame)
+        except (websockets.exceptions.ConnectionClosed, ConnectionError):
+            pass
     
+    async def close(self):
+        """Cancel outstanding requests once the client has disconnected"""
+        pending = list(self.tasks.values())
+        if self._untagged_worker is not None:
+            pending.append(self._untagged_worker)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+async def serve_websocket(websocket, make_connection: Callable, log: logging.Logger = logging.getLogger()):
+    """Feed a WebSocket client's JSON messages to a connection built by make_connection(send)"""
+    connection = make_connection(lambda frame: websocket.send(json.dumps(frame)))
     try:
         async for message in websocket:
-            request = json.loads(message)
-            response = await omnet.process_request(request)
-            await websocket.send(json.dumps(response))
+            await connection.dispatch(json.loads(message))
     except websockets.exceptions.ConnectionClosed:
         pass
     except Exception as e:
-        logging.error(f"WebSocket error: {str(e)}")
+        log.error(f"WebSocket error: {str(e)}")
+    finally:
+        await connection.close()
+
+async def serve_unix_stream(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+    make_connection: Callable, log: logging.Logger = logging.getLogger()
+):
+    """Feed a Unix socket client's frames to a connection built by make_connection(send)"""
+    codec = CODEC_JSON
+    
+    async def send(frame: Dict):
+        # Reply in whichever codec the client last used
+        writer.write(encode_frame(frame, codec))
+        await writer.drain()
+    
+    connection = make_connection(send)
+    try:
+        while True:
+            frame = await read_frame(reader)
+            if frame is None:
+                break
+            codec, request = frame
+            await connection.dispatch(request)
+    except (FrameError, ConnectionError) as e:
+        log.error(f"Unix socket error: {str(e)}")
+    finally:
+        await connection.close()
+        writer.close()
+
+# WebSocket server for real-time communication
+async def websocket_handler(websocket, path=None):
+    """Handle WebSocket connections from terminals and applications"""
+    await serve_websocket(websocket, lambda send: OMNetConnection(get_omnet_core(), send))
+
+# Unix domain socket server for local daemons (voice, gesture)
+async def unix_socket_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Handle length-prefixed JSON/msgpack frames from local clients"""
+    await serve_unix_stream(reader, writer, lambda send: OMNetConnection(get_omnet_core(), send))
 
-def start_omnet_server():
-    """Start the OMNet coordination server"""
+async def start_unix_server(path: Path = SOCKET_PATH) -> asyncio.AbstractServer:
+    """Listen on a Unix socket; access is governed by its file permissions"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.is_socket():
+        path.unlink()
+    server = await asyncio.start_unix_server(unix_socket_handler, str(path))
+    os.chmod(path, 0o660)
+    return server
+
+def start_omnet_server(worker_socket: Optional[Path] = None):
+    """Start the OMNet coordination server
+    
+    With worker_socket set, run as one worker behind omnet_supervisor.py:
+    serve only that Unix socket and leave the public endpoints to the router.
+    """
     print("🌌 Starting OMNet Neural Core...")
-    start_server = websockets.serve(websocket_handler, "localhost", 8765)
-    asyncio.get_event_loop().run_until_complete(start_server)
-    print("✅ OMNet Core active on localhost:8765")
-    asyncio.get_event_loop().run_forever()
+    omnet = get_omnet_core()
+    loop = asyncio.get_event_loop()
+    if worker_socket is None:
+        start_server = websockets.serve(websocket_handler, "localhost", 8765)
+        loop.run_until_complete(start_server)
+        loop.run_until_complete(start_unix_server())
+        endpoints = f"localhost:8765 and {SOCKET_PATH}"
+    else:
+        loop.run_until_complete(start_unix_server(worker_socket))
+        endpoints = f"{worker_socket} (worker)"
+    loop.create_task(omnet.watch_avatar_configs())
+    # Preload avatar models in the background; early requests just load on demand
+    loop.create_task(omnet.model_pool.maintain(omnet.ollama))
+    log_writer = loop.create_task(omnet.interaction_log.run())
+    # systemd stop and supervisor restarts send SIGTERM; leave run_forever
+    # so the interaction log is flushed below
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    print(f"✅ OMNet Core active on {endpoints}")
+    try:
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(omnet.interaction_log.close())
+        loop.run_until_complete(log_writer)
+
+def _fake_delay(text: str) -> float:
+    """Seconds the fake model takes: the leading number of the prompt, if any"""
+    try:
+        return float(text.split()[0])
+    except (IndexError, ValueError):
+        return 0.0
+
+async def _fake_ollama_handler(reader, writer):
+    """Minimal Ollama stand-in for /api/chat, /api/generate and /api/ps
+
+    Chat and generate sleep for the number of seconds the user message
+    starts with; an empty generate prompt (a model warm-up) returns at once.
+    """
+    try:
+        while True:
+            header = await reader.readuntil(b'\r\n\r\n')
+            lines = header.decode('latin-1').split('\r\n')
+            path = lines[0].split()[1]
+            length = 0
+            for line in lines:
+                if line.lower().startswith('content-length:'):
+                    length = int(line.split(':', 1)[1])
+            request = json.loads(await reader.readexactly(length)) if length else {}
+            if path == '/api/ps':
+                reply = {'models': []}
+            elif path == '/api/generate':
+                prompt = request.get('prompt') or ''
+                await asyncio.sleep(_fake_delay(prompt))
+                reply = {'model': request['model'], 'response': 'ok' if prompt else '', 'done': True}
+            else:
+                # Anything after the delay just keeps prompts distinct
+                await asyncio.sleep(_fake_delay(request['messages'][-1]['content']))
+                reply = {
+                    'model': request['model'],
+                    'message': {'role': 'assistant', 'content': 'ok'},
+                    'done': True
+                }
+            body = json.dumps(reply).encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+async def run_concurrency_selftest(concurrency: int = 8) -> bool:
+    """Check that concurrent generations overlap instead of queueing on the event loop"""
+    server = await asyncio.start_server(_fake_ollama_handler, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    
+    omnet = OMNetCore()
+    omnet.ollama = ollama.AsyncClient(host=f'http://127.0.0.1:{port}')
+    delays = [0.2 + 0.05 * i for i in range(concurrency)]
+    
+    started = time.monotonic()
+    responses = await asyncio.gather(*(
+        omnet.generate_response('selftest', '', str(delay)) for delay in delays
+    ))
+    elapsed = time.monotonic() - started
+    server.close()
+    
+    # generate_response turns failures into a fallback message, so check
+    # every answer really came from the fake model and took its full delay
+    answered = sum(response == 'ok' for response in responses)
+    passed = answered == concurrency and max(delays) <= elapsed < max(delays) + 0.5 * min(delays)
+    print(f"{concurrency} concurrent generations: {elapsed:.2f}s "
+          f"(slowest {max(delays):.2f}s, serial {sum(delays):.2f}s), "
+          f"{answered}/{concurrency} answered by the model "
+          f"{'✅' if passed else '❌'}")
+    return passed
 
 if __name__ == "__main__":
-    start_omnet_server()
+    if len(sys.argv) > 1 and sys.argv[1] == "selftest":
+        sys.exit(0 if asyncio.run(run_concurrency_selftest()) else 1)
+    if len(sys.argv) > 2 and sys.argv[1] == "--worker-socket":
+        start_omnet_server(worker_socket=Path(sys.argv[2]))
+    else:
+        start_omnet_server()
@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+"""
+OMNet Supervisor - Run several OMNet worker processes behind one front end
+Routes every session to the same worker so its in-memory state stays local
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import signal
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import websockets
+
+from ipc_transport import CODEC_JSON, SOCKET_PATH, FrameError, OMNetIPCClient
+from omnet_core import serve_unix_stream, serve_websocket
+
+OMNET_CORE = Path(__file__).resolve().parent / 'omnet_core.py'
+WORKER_SOCKET_DIR = SOCKET_PATH.parent / 'omnet-workers'
+
+HEALTH_INTERVAL = 5.0      # seconds between stats pings to each worker
+HEALTH_TIMEOUT = 2.0       # a ping slower than this counts as a failure
+HEALTH_FAILURES = 3        # consecutive failed pings before a worker is restarted
+STARTUP_TIMEOUT = 15.0     # time a new worker gets to answer its first ping
+RESTART_BACKOFF_MIN = 1.0
+RESTART_BACKOFF_MAX = 30.0
+STABLE_UPTIME = 60.0       # a worker that ran this long restarts with the minimum backoff
+
+UNAVAILABLE_MESSAGE = 'This avatar is regaining its balance. Please try again in a moment.'
+
+# Frames after which a worker sends nothing more for that request
+TERMINAL_TYPES = (None, 'done', 'error', 'cancelled', 'stats')
+
+logger = logging.getLogger('OMNet.supervisor')
+
+class WorkerProcess:
+    """One OMNet worker: its process, private socket and health record"""
+
+    def __init__(self, index: int, socket_path: Path):
+        self.index = index
+        self.socket_path = socket_path
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.healthy = False
+        self.started_at = 0.0
+        self.restarts = 0
+        self.failed_checks = 0
+        self.last_stats: Dict = {}
+
+    async def spawn(self):
+        """Start the worker process serving its private Unix socket"""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.is_socket():
+            self.socket_path.unlink()
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, str(OMNET_CORE), '--worker-socket', str(self.socket_path),
+            stdout=asyncio.subprocess.DEVNULL
+        )
+        self.started_at = time.monotonic()
+        self.failed_checks = 0
+
+    async def check_health(self) -> bool:
+        """Ping the worker with a stats request; keeps the reply for the supervisor's stats"""
+        try:
+            async with asyncio.timeout(HEALTH_TIMEOUT):
+                client = await OMNetIPCClient.connect(self.socket_path, CODEC_JSON)
+                try:
+                    await client.send({'type': 'stats'})
+                    reply = await client.recv()
+                finally:
+                    await client.close()
+        except (OSError, ConnectionError, FrameError, TimeoutError):
+            return False
+        self.last_stats = reply.get('stats', {})
+        return True
+
+    async def wait_ready(self, timeout: float = STARTUP_TIMEOUT) -> bool:
+        """Wait until a freshly spawned worker answers a ping"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline and self.process.returncode is None:
+            if await self.check_health():
+                return True
+            await asyncio.sleep(0.1)
+        return False
+
+    async def stop(self, grace: float = 5.0):
+        """Terminate the worker, killing it if it ignores SIGTERM"""
+        self.healthy = False
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), grace)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+    def get_stats(self) -> Dict:
+        running = self.process is not None and self.process.returncode is None
+        return {
+            'index': self.index,
+            'pid': self.process.pid if running else None,
+            'healthy': self.healthy,
+            'restarts': self.restarts,
+            'uptime_s': round(time.monotonic() - self.started_at, 1) if running else 0,
+            'stats': self.last_stats
+        }
+
+class OMNetSupervisor:
+    """
+    Runs N OMNet workers, each on its own Unix socket, and serves the public
+    WebSocket and Unix socket endpoints itself. Requests are routed by a hash
+    of their session_id, so a session always lands on the same worker while
+    that worker is healthy; if it is down, the session fails over to the next
+    healthy worker instead of erroring.
+
+    Each worker is pinged every HEALTH_INTERVAL seconds. A worker that exits,
+    or misses HEALTH_FAILURES pings in a row, is stopped and restarted with
+    exponential backoff, reset once a worker has stayed up STABLE_UPTIME.
+    """
+
+    def __init__(self, workers: int, worker_dir: Path = WORKER_SOCKET_DIR):
+        self.workers = [WorkerProcess(i, Path(worker_dir) / f"worker-{i}.sock") for i in range(workers)]
+        self.counters = {'routed': 0, 'failovers': 0, 'unavailable': 0, 'connections': 0}
+        self._stopping = False
+
+    def pick_worker(self, session_id) -> Optional[WorkerProcess]:
+        """The session's home worker, or the next healthy one while it is down"""
+        home = zlib.crc32(str(session_id).encode('utf-8')) % len(self.workers)
+        for offset in range(len(self.workers)):
+            worker = self.workers[(home + offset) % len(self.workers)]
+            if worker.healthy:
+                if offset:
+                    self.counters['failovers'] += 1
+                return worker
+        self.counters['unavailable'] += 1
+        return None
+
+    async def supervise(self, worker: WorkerProcess):
+        """Keep one worker running, restarting it when it dies or stops answering pings"""
+        backoff = RESTART_BACKOFF_MIN
+        while not self._stopping:
+            await worker.spawn()
+            exited = asyncio.ensure_future(worker.process.wait())
+            worker.healthy = await worker.wait_ready()
+            if worker.healthy:
+                logger.info(f"Worker {worker.index} ready (pid {worker.process.pid})")
+            else:
+                logger.error(f"Worker {worker.index} did not become ready")
+
+            while worker.healthy and not exited.done():
+                await asyncio.wait({exited}, timeout=HEALTH_INTERVAL)
+                if exited.done():
+                    logger.error(f"Worker {worker.index} exited with status {worker.process.returncode}")
+                    break
+                if await worker.check_health():
+                    worker.failed_checks = 0
+                    continue
+                worker.failed_checks += 1
+                logger.warning(f"Worker {worker.index} missed health check {worker.failed_checks}/{HEALTH_FAILURES}")
+                if worker.failed_checks >= HEALTH_FAILURES:
+                    break
+
+            await worker.stop()
+            exited.cancel()
+            if self._stopping:
+                return
+            if time.monotonic() - worker.started_at >= STABLE_UPTIME:
+                backoff = RESTART_BACKOFF_MIN
+            delay, backoff = backoff, min(backoff * 2, RESTART_BACKOFF_MAX)
+            worker.restarts += 1
+            logger.warning(f"Restarting worker {worker.index} in {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+    def unavailable_reply(self, request: Dict) -> Dict:
+        """Reply for a request no worker can take right now"""
+        frame = {
+            'avatar': request.get('avatar', 'krix'),
+            'response': UNAVAILABLE_MESSAGE,
+            'error': 'unavailable',
+            'timestamp': datetime.now().isoformat(),
+            'session_id': request.get('session_id', 'default')
+        }
+        if request.get('stream'):
+            frame = {'type': 'error', **frame}
+        return frame
+
+    def get_stats(self) -> Dict:
+        """Routing counters plus each worker's health and last reported stats"""
+        return {
+            **self.counters,
+            'workers': [worker.get_stats() for worker in self.workers]
+        }
+
+    async def websocket_handler(self, websocket, path=None):
+        """Route one WebSocket client's requests to the workers"""
+        await serve_websocket(websocket, lambda send: RoutedConnection(self, send), logger)
+
+    async def unix_socket_handler(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Route one local daemon's frames to the workers"""
+        await serve_unix_stream(reader, writer, lambda send: RoutedConnection(self, send), logger)
+
+    async def run(self, host: str = 'localhost', port: int = 8765, socket_path: Path = SOCKET_PATH):
+        """Start the workers and the public endpoints; returns after SIGTERM or SIGINT"""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+
+        supervisors = [asyncio.create_task(self.supervise(worker)) for worker in self.workers]
+        socket_path = Path(socket_path)
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if socket_path.is_socket():
+            socket_path.unlink()
+        ws_server = await websockets.serve(self.websocket_handler, host, port)
+        unix_server = await asyncio.start_unix_server(self.unix_socket_handler, str(socket_path))
+        os.chmod(socket_path, 0o660)
+        print(f"✅ OMNet Supervisor routing {len(self.workers)} workers on {host}:{port} and {socket_path}")
+
+        try:
+            await stop.wait()
+        finally:
+            self._stopping = True
+            ws_server.close()
+            unix_server.close()
+            for task in supervisors:
+                task.cancel()
+            await asyncio.gather(*supervisors, return_exceptions=True)
+            await asyncio.gather(*(worker.stop() for worker in self.workers))
+
+class RoutedConnection:
+    """Relays one client connection's requests to session-affine workers
+
+    Each client gets its own upstream connection per worker it talks to, so
+    request ids cannot collide between clients and closing the client closes
+    the upstreams, which cancels its in-flight work on the workers. Untagged
+    requests are given internal ids upstream and answered one at a time, in
+    order, exactly as a single OMNet process would.
+    """
+
+    def __init__(self, supervisor: OMNetSupervisor, send: Callable[[Dict], Awaitable[None]]):
+        self.supervisor = supervisor
+        self.send = send
+        self.upstreams: Dict[int, OMNetIPCClient] = {}
+        self.relays: Dict[int, asyncio.Task] = {}
+        self.routes: Dict[str, tuple] = {}  # upstream request_id -> (worker index, request)
+        self.untagged_done: Dict[str, asyncio.Future] = {}
+        self._untagged: asyncio.Queue = asyncio.Queue()
+        self._untagged_worker: Optional[asyncio.Task] = None
+        self._untagged_ids = itertools.count()
+        supervisor.counters['connections'] += 1
+
+    async def dispatch(self, request: Dict):
+        """Forward a request to its worker without waiting for the reply"""
+        request_id = request.get('request_id')
+        if request.get('type') == 'stats':
+            await self._send({'type': 'stats', 'stats': self.supervisor.get_stats()}, request_id)
+            return
+        if request.get('type') == 'cancel':
+            route = self.routes.get(str(request_id))
+            if route is None or route[0] not in self.upstreams:
+                await self._send({
+                    'type': 'error',
+                    'request_id': request_id,
+                    'error': 'no request with this request_id is in flight'
+                })
+                return
+            await self._forward(route[0], request)
+            return
+        if request_id is None:
+            if self._untagged_worker is None:
+                self._untagged_worker = asyncio.create_task(self._serve_untagged())
+            self._untagged.put_nowait(request)
+            return
+        if str(request_id) in self.routes:
+            await self._send({
+                'type': 'error',
+                'request_id': request_id,
+                'error': 'request_id already in flight on this connection'
+            })
+            return
+        await self._route(request)
+
+    async def _serve_untagged(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            request = await self._untagged.get()
+            key = f"~{next(self._untagged_ids)}"
+            done = self.untagged_done[key] = loop.create_future()
+            await self._route({**request, 'request_id': key})
+            await done
+
+    async def _route(self, request: Dict):
+        key = str(request['request_id'])
+        worker = self.supervisor.pick_worker(request.get('session_id', 'default'))
+        if worker is not None:
+            try:
+                upstream = await self._upstream(worker.index)
+                self.routes[key] = (worker.index, request)
+                await upstream.send(request)
+                self.supervisor.counters['routed'] += 1
+                return
+            except (OSError, ConnectionError) as e:
+                self.routes.pop(key, None)
+                logger.warning(f"Worker {worker.index} unreachable: {str(e)}")
+        await self._reply(self.supervisor.unavailable_reply(request), request['request_id'])
+
+    async def _upstream(self, index: int) -> OMNetIPCClient:
+        upstream = self.upstreams.get(index)
+        if upstream is None:
+            upstream = await OMNetIPCClient.connect(self.supervisor.workers[index].socket_path)
+            self.upstreams[index] = upstream
+            self.relays[index] = asyncio.create_task(self._relay(index, upstream))
+        return upstream
+
+    async def _forward(self, index: int, request: Dict):
+        try:
+            await self.upstreams[index].send(request)
+        except (KeyError, OSError, ConnectionError):
+            pass
+
+    async def _relay(self, index: int, upstream: OMNetIPCClient):
+        """Pass a worker's replies back to the client"""
+        try:
+            while True:
+                frame = await upstream.recv()
+                await self._reply(frame)
+        except (OSError, ConnectionError, FrameError) as e:
+            logger.warning(f"Lost connection to worker {index}: {str(e)}")
+        finally:
+            self.upstreams.pop(index, None)
+            self.relays.pop(index, None)
+            # Fail whatever the worker was still handling for this client
+            for key, (routed_to, request) in list(self.routes.items()):
+                if routed_to == index:
+                    await self._reply(self.supervisor.unavailable_reply(request), request['request_id'])
+
+    async def _reply(self, frame: Dict, request_id=None):
+        if request_id is not None:
+            frame['request_id'] = request_id
+        key = str(frame.get('request_id'))
+        terminal = frame.get('type') in TERMINAL_TYPES
+        if terminal:
+            self.routes.pop(key, None)
+        done = self.untagged_done.get(key)
+        if done is not None:
+            # Internal id of an untagged request; the client never saw it
+            del frame['request_id']
+        await self._send(frame)
+        if done is not None and terminal:
+            del self.untagged_done[key]
+            done.set_result(None)
+
+    async def _send(self, frame: Dict, request_id=None):
+        if request_id is not None:
+            frame['request_id'] = request_id
+        try:
+            await self.send(frame)
+        except (websockets.exceptions.ConnectionClosed, ConnectionError):
+            pass
+
+    async def close(self):
+        """Drop the upstream connections; the workers cancel this client's requests"""
+        if self._untagged_worker is not None:
+            self._untagged_worker.cancel()
+        for upstream in list(self.upstreams.values()):
+            upstream.writer.close()
+        relays = list(self.relays.values())
+        for task in relays:
+            task.cancel()
+        if relays or self._untagged_worker is not None:
+            await asyncio.gather(*relays, *filter(None, [self._untagged_worker]), return_exceptions=True)
+
+# Load benchmark: a fake Ollama that answers instantly, so throughput is bounded
+# by OMNet's own per-request work (framing, JSON, prompt building, logging)
+def _serve_fake_ollama(sock):
+    from omnet_core import _fake_ollama_handler
+
+    async def serve():
+        server = await asyncio.start_server(_fake_ollama_handler, sock=sock)
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+async def _bench_client(socket_path: Path, index: int, requests: int, results: Dict):
+    client = await OMNetIPCClient.connect(socket_path)
+    try:
+        for n in range(requests):
+            # Spread each client over several sessions so every worker gets traffic
+            await client.send({
+                'avatar': 'krix',
+                'input': f"0 bench {index}-{n}",
+                'session_id': f"bench-{index}-{n % 8}",
+                'request_id': n
+            })
+            reply = await client.recv()
+            results['failed' if 'error' in reply else 'ok'] += 1
+    finally:
+        await client.close()
+
+async def _bench_once(workers: int, clients: int, requests: int, ollama_host: str) -> Dict:
+    with tempfile.TemporaryDirectory(prefix='omnet-bench-') as tmp:
+        socket_path = Path(tmp) / 'omnet.sock'
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, str(Path(__file__).resolve()),
+            '--workers', str(workers), '--port', '0',
+            '--socket', str(socket_path), '--worker-dir', str(Path(tmp) / 'workers'),
+            env={**os.environ, 'OLLAMA_HOST': ollama_host},
+            stdout=asyncio.subprocess.DEVNULL
+        )
+        try:
+            # Wait until every worker reports healthy
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + STARTUP_TIMEOUT * 2
+            while True:
+                try:
+                    probe = await OMNetIPCClient.connect(socket_path, CODEC_JSON)
+                    await probe.send({'type': 'stats'})
+                    stats = (await probe.recv())['stats']
+                    await probe.close()
+                    if all(worker['healthy'] for worker in stats['workers']):
+                        break
+                except (OSError, ConnectionError):
+                    pass
+                if loop.time() > deadline:
+                    raise RuntimeError(f"{workers} workers did not become ready")
+                await asyncio.sleep(0.2)
+
+            results = {'ok': 0, 'failed': 0}
+            started = time.monotonic()
+            await asyncio.gather(*(
+                _bench_client(socket_path, i, requests, results) for i in range(clients)
+            ))
+            elapsed = time.monotonic() - started
+        finally:
+            process.terminate()
+            await process.wait()
+    return {
+        'workers': workers,
+        'ok': results['ok'],
+        'failed': results['failed'],
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(results['ok'] / elapsed, 1)
+    }
+
+def run_load_benchmark(worker_counts: List[int], clients: int = 16, requests: int = 500) -> List[Dict]:
+    """Measure routed request throughput for each worker count"""
+    import multiprocessing
+    import socket
+
+    listener = socket.create_server(('127.0.0.1', 0))
+    ollama_host = f"http://127.0.0.1:{listener.getsockname()[1]}"
+    fake_ollama = multiprocessing.get_context('fork').Process(target=_serve_fake_ollama, args=(listener,), daemon=True)
+    fake_ollama.start()
+    listener.close()
+
+    cpus = os.cpu_count() or 1
+    print(f"{clients} clients x {requests} requests, {cpus} CPUs")
+    # Workers beyond the CPU count only contend for the same cores
+    skipped = [workers for workers in worker_counts if workers > cpus and workers != min(worker_counts)]
+    if skipped:
+        print(f"  skipping {', '.join(map(str, skipped))} workers: more workers than CPUs cannot scale")
+    results = []
+    try:
+        baseline = None
+        for workers in (n for n in worker_counts if n not in skipped):
+            result = asyncio.run(_bench_once(workers, clients, requests, ollama_host))
+            baseline = baseline or result['requests_per_second']
+            print(f"  {workers:>2} workers: {result['requests_per_second']:>8.1f} req/s "
+                  f"({result['requests_per_second'] / baseline:.2f}x, {result['failed']} failed)")
+            results.append(result)
+    finally:
+        fake_ollama.terminate()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Run OMNet as several session-affine worker processes')
+    parser.add_argument('mode', nargs='?', choices=['serve', 'bench'], default='serve')
+    parser.add_argument('--workers', help='worker processes to run (default: one per CPU); '
+                                          'for bench, comma-separated counts to compare')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', type=Path, default=SOCKET_PATH)
+    parser.add_argument('--worker-dir', type=Path, default=WORKER_SOCKET_DIR)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500, help='requests per bench client')
+    args = parser.parse_args()
+
+    if args.mode == 'bench':
+        counts = [int(n) for n in (args.workers or '1,2,4').split(',')]
+        run_load_benchmark(counts, args.clients, args.requests)
+        return
+
+    log_dir = Path('/var/log/kalki')
+    log_dir.mkdir(exist_ok=True, parents=True)
+    logging.basicConfig(
+        filename=log_dir / 'omnet.log',
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    print("🌌 Starting OMNet Supervisor...")
+    workers = int(args.workers or os.cpu_count() or 1)
+    asyncio.run(OMNetSupervisor(workers, args.worker_dir).run(args.host, args.port, args.socket))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Response Cache - Reuse generations for repeated avatar prompts
+Size-bounded LRU with a TTL, keyed on (model, system prompt, user input)
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from inference_scheduler import INFERENCE_SETTINGS_FILE, load_inference_settings
+
+_shared_cache: Optional['ResponseCache'] = None
+
+class ResponseCache:
+    """
+    Caches responses to history-free prompts such as gesture summons, voice
+    greetings and repeated help questions. Each response is one entry,
+    keyed on (model, system prompt, user input). With normalize enabled
+    the input's surrounding whitespace is stripped and runs of whitespace
+    folded first, so "hello  krix\n" and "hello krix" share the entry;
+    case and punctuation always count, since they can change the answer
+    (code, paths, questions vs. statements).
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 600, normalize: bool = False):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.normalize = normalize
+        self.entries: OrderedDict = OrderedDict()  # key -> (expires_at, response, answered_by)
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    @classmethod
+    def from_settings(cls, settings_file=INFERENCE_SETTINGS_FILE) -> 'ResponseCache':
+        """Build a cache from the 'response_cache' block of inference-settings.yaml"""
+        settings = load_inference_settings(settings_file).get('response_cache') or {}
+        return cls(
+            max_entries=int(settings.get('max_entries', 512)),
+            ttl_seconds=float(settings.get('ttl_seconds', 600)),
+            normalize=bool(settings.get('normalize', False))
+        )
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Fold whitespace only"""
+        return ' '.join(text.split())
+
+    def _key(self, model: str, system_prompt: str, user_input: str) -> str:
+        if self.normalize:
+            user_input = self.normalize_text(user_input)
+        return hashlib.sha256(f"{model}\0{system_prompt}\0{user_input}".encode()).hexdigest()
+
+    def get(self, model: str, system_prompt: str, user_input: str) -> Optional[str]:
+        """Return a cached response, or None on a miss"""
+        entry = self.lookup(model, system_prompt, user_input)
+        return entry[0] if entry else None
+
+    def lookup(self, model: str, system_prompt: str, user_input: str) -> Optional[Tuple[str, str]]:
+        """
+        Return (response, model that generated it), or None on a miss
+
+        The generating model differs from the requested one when a cascade
+        tier or fallback answered in its place.
+        """
+        key = self._key(model, system_prompt, user_input)
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, response, answered_by = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return response, answered_by
+            del self.entries[key]
+            self.stats['expired'] += 1
+
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, model: str, system_prompt: str, user_input: str, response: str, answered_by: Optional[str] = None):
+        """Store a response; answered_by defaults to model"""
+        key = self._key(model, system_prompt, user_input)
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, response, answered_by or model)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def get_stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'entries': len(self.entries),
+            'hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else 0.0
+        }
+
+def get_response_cache() -> ResponseCache:
+    """Return the response cache shared by every model caller in this process"""
+    global _shared_cache
+
+    if _shared_cache is None:
+        _shared_cache = ResponseCache.from_settings()
+    return _shared_cache
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Session Catalog - Indexed metadata for saved conversation sessions
+Lists a user's recent sessions without walking and parsing the session directory
+"""
+
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from inference_scheduler import INFERENCE_SETTINGS_FILE, load_inference_settings
+from session_journal import SESSIONS_DIR, SessionJournal
+
+CATALOG_FILE = SESSIONS_DIR / 'catalog.db'
+TITLE_CHARS = 80
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id TEXT NOT NULL,
+    avatar_name TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    last_updated TEXT NOT NULL,
+    message_count INTEGER NOT NULL,
+    title TEXT,
+    PRIMARY KEY (user_id, avatar_name, session_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_recent
+    ON sessions (user_id, last_updated DESC, avatar_name, session_id);
+"""
+
+class SessionCatalog:
+    """
+    One SQLite row per saved session: user, avatar, session id,
+    last_updated, message count and a title taken from the first user
+    message. The session files stay the source of truth; the catalog only
+    makes them findable, and rebuild() recreates it from them.
+
+    Recent-session listings walk the (user_id, last_updated DESC) index and
+    page with a keyset cursor, the last row's (last_updated, avatar_name,
+    session_id), so each page costs the same however deep into the
+    listing it is. The database runs in WAL mode and every update is its
+    own transaction.
+    """
+
+    def __init__(self, path: Path = CATALOG_FILE, title_chars: int = TITLE_CHARS):
+        self.path = Path(path)
+        self.title_chars = title_chars
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Saves happen on the event loop and in store evictions; one
+        # connection behind a lock keeps them serialised
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_settings(cls, settings_file: Path = INFERENCE_SETTINGS_FILE) -> 'SessionCatalog':
+        """Build from the 'session_catalog' block of inference-settings.yaml"""
+        settings = load_inference_settings(settings_file).get('session_catalog') or {}
+        return cls(
+            path=Path(settings.get('path') or CATALOG_FILE),
+            title_chars=int(settings.get('title_chars', TITLE_CHARS))
+        )
+
+    def make_title(self, history: List[Dict]) -> Optional[str]:
+        """First line of the first user message, shortened to title_chars"""
+        for message in history:
+            if message.get('role') == 'user' and message.get('content', '').strip():
+                title = message['content'].strip().splitlines()[0]
+                if len(title) > self.title_chars:
+                    title = title[:self.title_chars - 1].rstrip() + '…'
+                return title
+        return None
+
+    def record(
+        self, user_id: str, avatar_name: str, session_id: str,
+        last_updated: str, message_count: int, title: Optional[str] = None
+    ):
+        """
+        Insert or update a session's row
+
+        A given title replaces the stored one, so a new session started
+        under an existing id is listed under its own first message; the
+        stored title is kept only when none is given.
+        """
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.execute(
+                    """
+                    INSERT INTO sessions (user_id, avatar_name, session_id, last_updated, message_count, title)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, avatar_name, session_id) DO UPDATE SET
+                        last_updated = excluded.last_updated,
+                        message_count = excluded.message_count,
+                        title = COALESCE(excluded.title, sessions.title)
+                    """,
+                    (user_id, avatar_name, session_id, last_updated, message_count, title)
+                )
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def remove(self, user_id: str, avatar_name: str, session_id: str):
+        with self._lock:
+            self.conn.execute(
+                'DELETE FROM sessions WHERE user_id = ? AND avatar_name = ? AND session_id = ?',
+                (user_id, avatar_name, session_id)
+            )
+
+    def get(self, user_id: str, avatar_name: str, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT user_id, avatar_name, session_id, last_updated, message_count, title FROM sessions '
+                'WHERE user_id = ? AND avatar_name = ? AND session_id = ?',
+                (user_id, avatar_name, session_id)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def recent(
+        self, user_id: str, limit: int = 20, cursor: Optional[Tuple[str, str, str]] = None,
+        avatar_name: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[Tuple[str, str, str]]]:
+        """
+        Return (sessions newest first, cursor for the next page or None)
+
+        cursor is the value returned with the previous page.
+        """
+        query = ('SELECT user_id, avatar_name, session_id, last_updated, message_count, title '
+                 'FROM sessions WHERE user_id = ?')
+        params: list = [user_id]
+        if avatar_name is not None:
+            query += ' AND avatar_name = ?'
+            params.append(avatar_name)
+        if cursor is not None:
+            last_updated, cursor_avatar, cursor_session = cursor
+            query += (' AND (last_updated < ? OR (last_updated = ? AND '
+                      '(avatar_name > ? OR (avatar_name = ? AND session_id > ?))))')
+            params += [last_updated, last_updated, cursor_avatar, cursor_avatar, cursor_session]
+        query += ' ORDER BY last_updated DESC, avatar_name, session_id LIMIT ?'
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        sessions = [self._row(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = sessions[-1]
+            next_cursor = (last['last_updated'], last['avatar_name'], last['session_id'])
+        return sessions, next_cursor
+
+    def count(self, user_id: Optional[str] = None) -> int:
+        with self._lock:
+            if user_id is None:
+                return self.conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+            return self.conn.execute('SELECT COUNT(*) FROM sessions WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+    def rebuild(self, journal: SessionJournal) -> int:
+        """Recreate every row from the session files under journal.root; returns the row count"""
+        rows = []
+        seen = set()
+        for path in sorted(journal.root.glob('*/*')):
+            if path.suffix not in ('.json', '.journal') or path.name.startswith('.'):
+                continue
+            user_id = path.parent.name
+            if (user_id, path.stem) in seen:
+                continue
+            seen.add((user_id, path.stem))
+            avatar_name, _, session_id = path.stem.partition('_')
+            session_data = journal.load(user_id, avatar_name, session_id)
+            if not session_data:
+                continue
+            context = session_data['context']
+            history = context.get('conversation_history', [])
+            rows.append((
+                context.get('user_id', user_id), context.get('avatar_name', avatar_name),
+                context.get('session_id', session_id), session_data.get('last_updated') or '',
+                len(history), self.make_title(history)
+            ))
+
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.execute('DELETE FROM sessions')
+                self.conn.executemany('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?)', rows)
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    @staticmethod
+    def _row(row) -> Dict:
+        return {
+            'user_id': row[0],
+            'avatar_name': row[1],
+            'session_id': row[2],
+            'last_updated': row[3],
+            'message_count': row[4],
+            'title': row[5]
+        }
+
+def run_catalog_benchmark(sessions: int = 50000, users: int = 5, pages: int = 50) -> bool:
+    """Fill a scratch catalog and time saves and paginated recent-session queries"""
+    import tempfile
+    from datetime import datetime, timedelta
+
+    with tempfile.TemporaryDirectory(prefix='kalki-catalog-bench-') as tmp:
+        catalog = SessionCatalog(Path(tmp) / 'catalog.db')
+        epoch = datetime(2024, 1, 1)
+        started = time.monotonic()
+        for n in range(sessions):
+            catalog.record(
+                f"user{n % users}", ('mushak', 'krix', 'shera')[n % 3], f"session-{n}",
+                (epoch + timedelta(seconds=n)).isoformat(), 2 + n % 40, f"question {n}"
+            )
+        save_ms = (time.monotonic() - started) * 1000 / sessions
+
+        timings = []
+        seen = 0
+        cursor = None
+        for _ in range(pages):
+            started = time.monotonic()
+            page, cursor = catalog.recent('user0', limit=20, cursor=cursor)
+            timings.append((time.monotonic() - started) * 1000)
+            seen += len(page)
+            if cursor is None:
+                break
+        catalog.close()
+
+    timings.sort()
+    worst = timings[-1]
+    ok = seen == min(pages * 20, -(-sessions // users)) and worst < 50
+    print(f"{sessions} sessions recorded at {save_ms:.2f} ms/save")
+    print(f"{len(timings)} pages of recent sessions: median {timings[len(timings) // 2]:.2f} ms, "
+          f"worst {worst:.2f} ms {'✅' if ok else '❌'}")
+    return ok
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+        sys.exit(0 if run_catalog_benchmark(count) else 1)
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        catalog = SessionCatalog.from_settings()
+        print(f"Catalogued {catalog.rebuild(SessionJournal())} sessions in {catalog.path}")
+        sys.exit(0)
+    print("Run with 'bench [sessions]' to time the catalog, or 'rebuild' to re-index the session files.")
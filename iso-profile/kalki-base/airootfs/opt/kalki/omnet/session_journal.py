@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Session Journal - Append-only persistence for conversation sessions
+Each turn appends a small record; the journal is periodically compacted into a snapshot
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger('avatar_communication.journal')
+
+SESSIONS_DIR = Path('/var/lib/kalki/sessions')
+
+class SessionJournal:
+    """
+    Persists sessions as {user}/{avatar}_{session}.json (snapshot, same
+    format as before) plus {avatar}_{session}.journal (one JSON record per
+    saved turn).
+
+    A record holds the turn's new messages, the index in the history where
+    they start, and the session's non-history state. Replaying a record
+    truncates the history to that index before extending it, so replaying a
+    record that is already in the snapshot changes nothing. This makes
+    compaction safe without sequence numbers: the snapshot is written to a
+    temporary file, fsynced and renamed over the old one before the journal
+    is truncated, and a crash anywhere in between only leaves records that
+    replay idempotently. A torn line left by a crash mid-append is skipped
+    on load, and the next append starts on a fresh line.
+    """
+
+    def __init__(self, root: Path = SESSIONS_DIR, compact_bytes: int = 256 * 1024, fsync: bool = True):
+        self.root = Path(root)
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+
+    def paths(self, user_id: str, avatar_name: str, session_id: str) -> Tuple[Path, Path]:
+        """(snapshot, journal) paths for a session"""
+        base = self.root / user_id / f"{avatar_name}_{session_id}"
+        return base.with_name(base.name + '.json'), base.with_name(base.name + '.journal')
+
+    def append(
+        self, user_id: str, avatar_name: str, session_id: str,
+        state: Dict, start: int, messages: List[Dict], last_updated: Optional[str] = None
+    ) -> bool:
+        """Append one turn; returns True once the journal is due for compaction"""
+        _, journal = self.paths(user_id, avatar_name, session_id)
+        journal.parent.mkdir(parents=True, exist_ok=True)
+        record = {
+            'at': start,
+            'messages': messages,
+            'state': state,
+            'last_updated': last_updated or datetime.utcnow().isoformat()
+        }
+        line = (json.dumps(record) + '\n').encode('utf-8')
+        with open(journal, 'ab+') as f:
+            # Start on a fresh line if a crash left a torn record at the end
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    line = b'\n' + line
+            f.write(line)
+            f.flush()
+            if self.fsync:
+                os.fdatasync(f.fileno())
+            return f.tell() >= self.compact_bytes
+
+    def compact(self, user_id: str, avatar_name: str, session_id: str, session_data: Dict):
+        """Replace the snapshot with session_data and empty the journal"""
+        snapshot, journal = self.paths(user_id, avatar_name, session_id)
+        snapshot.parent.mkdir(parents=True, exist_ok=True)
+        tmp = snapshot.with_name(f".{snapshot.name}.{os.getpid()}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(session_data, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, snapshot)
+        self._fsync_dir(snapshot.parent)
+        # Only now is it safe to drop the records the snapshot covers
+        with open(journal, 'w', encoding='utf-8'):
+            pass
+
+    def _fsync_dir(self, directory: Path):
+        if not self.fsync:
+            return
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def load(self, user_id: str, avatar_name: str, session_id: str) -> Optional[Dict]:
+        """Rebuild {'context': ..., 'last_updated': ...} from snapshot plus journal, or None"""
+        snapshot, journal = self.paths(user_id, avatar_name, session_id)
+        session_data = None
+        try:
+            with open(snapshot, 'r', encoding='utf-8') as f:
+                session_data = json.load(f)
+        except FileNotFoundError:
+            pass
+
+        try:
+            with open(journal, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            lines = []
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping torn record in {journal}")
+                continue
+            context = dict(session_data['context']) if session_data else {}
+            history = context.get('conversation_history', [])[:record['at']]
+            context.update(record['state'])
+            context['conversation_history'] = history + record['messages']
+            session_data = {'context': context, 'last_updated': record['last_updated']}
+        return session_data
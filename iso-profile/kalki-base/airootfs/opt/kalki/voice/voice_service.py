@@ -56,7 +56,8 @@ class VoiceService:
             payload = {
                 'avatar': self.current_avatar,
                 'input': text,
-                'session_id': f'voice_{self.current_avatar}'
+                'session_id': f'voice_{self.current_avatar}',
+                'priority': 'voice'
             }
             
             await self.omnet_ws.send(json.dumps(payload))